@@ -0,0 +1,180 @@
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional, Set
+
+from .config import RAG_MAX_INFLIGHT, RAG_MAX_QUEUE, RAG_QUEUE_TIMEOUT_S
+
+
+class OverloadedError(RuntimeError):
+    """La consulta se rechaza sin procesarla (cola llena o espera agotada)."""
+
+
+# -------------------------
+# Plazo por consulta
+# -------------------------
+class Deadline:
+    """Presupuesto de tiempo de una consulta, compartido por recuperacion y generacion."""
+
+    def __init__(self, budget_s: Optional[float]) -> None:
+        self.budget_s = budget_s
+        self.started = time.monotonic()
+        self._end = None if budget_s is None else self.started + max(0.0, float(budget_s))
+
+    def remaining(self) -> Optional[float]:
+        """Segundos que quedan (None = sin limite)."""
+        if self._end is None:
+            return None
+        return max(0.0, self._end - time.monotonic())
+
+
+# -------------------------
+# Control de admision
+# -------------------------
+class _Lease:
+    """
+    Hueco ocupado por una consulta. Se libera cuando la consulta ha salido del slot Y han
+    terminado las tareas en segundo plano que registro (hold): una consulta que devuelve
+    "partial" con el embedding o el LLM aun en marcha sigue contando contra max_inflight.
+    """
+
+    def __init__(self, controller: "AdmissionController") -> None:
+        self._controller = controller
+        self._lock = threading.Lock()
+        self._pending: Set[Future] = set()
+        self._closed = False
+        self._released = False
+
+    def hold(self, fut: Future) -> None:
+        with self._lock:
+            self._pending.add(fut)
+        fut.add_done_callback(self._finished)  # si ya ha terminado se llama aqui mismo
+
+    def _finished(self, fut: Future) -> None:
+        with self._lock:
+            self._pending.discard(fut)
+            ready = self._closed and not self._pending and not self._released
+            if ready:
+                self._released = True
+        if ready:
+            self._controller.release()
+
+    def close(self) -> bool:
+        """Marca la salida de la consulta; True si el hueco se ha liberado ya."""
+        with self._lock:
+            self._closed = True
+            ready = not self._pending and not self._released
+            if ready:
+                self._released = True
+        if ready:
+            self._controller.release()
+        return ready
+
+
+_LEASE: ContextVar[Optional[_Lease]] = ContextVar("admission_lease", default=None)
+
+
+def hold_slot(fut: Future) -> None:
+    """Mantiene ocupado el hueco de la consulta en curso (si la hay) hasta que termine fut."""
+    lease = _LEASE.get()
+    if lease is not None:
+        lease.hold(fut)
+
+
+class AdmissionController:
+    """
+    Limita las consultas en curso a max_inflight. Las que no caben esperan en una cola
+    acotada (max_queue); si la cola esta llena se rechazan al momento (fast-fail) y si
+    la espera supera queue_timeout_s (o el plazo de la consulta) se descartan.
+    El trabajo que una consulta deja en marcha (ver hold_slot) sigue ocupando su hueco.
+    """
+
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout_s: float) -> None:
+        self.max_inflight = max(1, int(max_inflight))
+        self.max_queue = max(0, int(max_queue))
+        self.queue_timeout_s = float(queue_timeout_s)
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._queued = 0
+        self._stats: Dict[str, int] = {
+            "admitted": 0,
+            "completed": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "deferred_releases": 0,
+            "max_queue_depth": 0,
+        }
+
+    def acquire(self, deadline: Optional[Deadline] = None) -> None:
+        with self._cond:
+            if self._inflight < self.max_inflight and self._queued == 0:
+                self._inflight += 1
+                self._stats["admitted"] += 1
+                return
+            if self._queued >= self.max_queue:
+                self._stats["rejected_queue_full"] += 1
+                raise OverloadedError("Cola de consultas llena.")
+
+            wait_s = self.queue_timeout_s
+            rem = deadline.remaining() if deadline is not None else None
+            if rem is not None:
+                wait_s = min(wait_s, rem)
+            end = time.monotonic() + wait_s
+            self._queued += 1
+            self._stats["max_queue_depth"] = max(self._stats["max_queue_depth"], self._queued)
+            try:
+                while self._inflight >= self.max_inflight:
+                    left = end - time.monotonic()
+                    if left <= 0:
+                        self._stats["rejected_timeout"] += 1
+                        raise OverloadedError(f"Sin hueco libre tras {wait_s:.1f} s en cola.")
+                    self._cond.wait(left)
+            finally:
+                self._queued -= 1
+            self._inflight += 1
+            self._stats["admitted"] += 1
+
+    def release(self) -> None:
+        with self._cond:
+            self._inflight -= 1
+            self._stats["completed"] += 1
+            self._cond.notify()
+
+    @contextmanager
+    def slot(self, deadline: Optional[Deadline] = None) -> Iterator[None]:
+        self.acquire(deadline)
+        lease = _Lease(self)
+        token = _LEASE.set(lease)
+        try:
+            yield
+        finally:
+            _LEASE.reset(token)
+            if not lease.close():
+                with self._cond:
+                    self._stats["deferred_releases"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            out: Dict[str, Any] = dict(self._stats)
+            out["in_flight"] = self._inflight
+            out["queue_depth"] = self._queued
+        out["max_inflight"] = self.max_inflight
+        out["max_queue"] = self.max_queue
+        return out
+
+
+_CONTROLLER = AdmissionController(RAG_MAX_INFLIGHT, RAG_MAX_QUEUE, RAG_QUEUE_TIMEOUT_S)
+
+
+def admission_slot(deadline: Optional[Deadline] = None):
+    """Hueco de ejecucion del controlador global (context manager); lanza OverloadedError."""
+    return _CONTROLLER.slot(deadline)
+
+
+def admission_stats() -> Dict[str, Any]:
+    """Consultas en curso, profundidad de cola y contadores de rechazos (para monitorizar)."""
+    return _CONTROLLER.stats()
@@ -0,0 +1,240 @@
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import re
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+
+# -------------------------
+# Almacen binario de chunks (independiente del indice vectorial)
+# -------------------------
+# Se escribe al construir el indice, en <indice>/chunks/:
+#   - text.bin     : texto UTF-8 de todos los chunks, contiguo
+#   - offsets.npy  : int64 (n+1) con el byte de inicio de cada chunk (el chunk i es [o[i], o[i+1]))
+#   - source.npy   : int32 id de fuente (indice en sources.json, rutas internadas)
+#   - page.npy     : int32 pagina 0-based
+#   - ingest.npy   : int32 fecha de ingesta YYYYMMDD (0 si no consta)
+#   - parent.npy   : int32 id de padre (indice en parents.json, -1 si no hay)
+#   - sources.json / parents.json / chunk_meta.json
+# El id de chunk es su posicion; se guarda en metadata['chunk_id'] de cada chunk indexado.
+CHUNK_STORE_DIR = "chunks"
+CHUNK_META = "chunk_meta.json"
+_TEXT_FILE = "text.bin"
+_OFFSETS_FILE = "offsets.npy"
+_COLUMNS = ("source", "page", "ingest", "parent")
+_SOURCES_FILE = "sources.json"
+_PARENTS_FILE = "parents.json"
+
+
+def chunk_store_dir(index_dir: Path) -> Path:
+    return Path(index_dir) / CHUNK_STORE_DIR
+
+
+def _intern(values: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+    """Devuelve (tabla de valores unicos, ids int32 por fila); '' se interna como -1."""
+    table: List[str] = []
+    seen: Dict[str, int] = {}
+    ids = np.empty(len(values), dtype=np.int32)
+    for i, v in enumerate(values):
+        if not v:
+            ids[i] = -1
+            continue
+        j = seen.get(v)
+        if j is None:
+            j = seen[v] = len(table)
+            table.append(v)
+        ids[i] = j
+    return table, ids
+
+
+def _int_or(value: Any, default: int) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def write_chunk_store(
+    index_dir: Path,
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+) -> Path:
+    """Escribe el almacen de chunks de un indice (mismo orden que texts) y devuelve su carpeta."""
+    if len(texts) != len(metadatas):
+        raise ValueError("texts y metadatas deben tener la misma longitud.")
+    out_dir = chunk_store_dir(index_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    offsets = np.zeros(len(texts) + 1, dtype=np.int64)
+    with (out_dir / _TEXT_FILE).open("wb") as f:
+        for i, text in enumerate(texts):
+            data = (text or "").encode("utf-8")
+            f.write(data)
+            offsets[i + 1] = offsets[i] + len(data)
+    np.save(out_dir / _OFFSETS_FILE, offsets)
+
+    metas = [m or {} for m in metadatas]
+    sources, source_ids = _intern([str(m.get("source", "")) for m in metas])
+    parents, parent_ids = _intern([str(m.get("parent_id") or "") for m in metas])
+    np.save(out_dir / "source.npy", source_ids)
+    np.save(out_dir / "page.npy", np.array([_int_or(m.get("page"), 0) for m in metas], dtype=np.int32))
+    np.save(out_dir / "ingest.npy", np.array([_int_or(m.get("ingest_date"), 0) for m in metas], dtype=np.int32))
+    np.save(out_dir / "parent.npy", parent_ids)
+    (out_dir / _SOURCES_FILE).write_text(json.dumps(sources, ensure_ascii=False), encoding="utf-8")
+    (out_dir / _PARENTS_FILE).write_text(json.dumps(parents), encoding="utf-8")
+
+    info = {
+        "count": len(texts),
+        "text_bytes": int(offsets[-1]),
+        "n_sources": len(sources),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    (out_dir / CHUNK_META).write_text(json.dumps(info, indent=2), encoding="utf-8")
+    print(f"[CHUNKS] Guardados {len(texts)} chunks ({info['text_bytes']} bytes) en {out_dir}")
+    return out_dir
+
+
+def chunk_store_from_chroma(index_dir: Path) -> Path:
+    """Genera el almacen de chunks de un indice Chroma existente (orden de la coleccion)."""
+    from langchain_community.vectorstores import Chroma
+
+    vs = Chroma(persist_directory=str(index_dir))
+    data = vs._collection.get(include=["documents", "metadatas"])
+    return write_chunk_store(index_dir, data["documents"], data["metadatas"])
+
+
+class ChunkStore:
+    """
+    Lectura de chunks por id sin abrir el indice vectorial: el texto se mapea en memoria
+    y cada chunk es un slice del blob; las columnas de metadatos son arrays numpy (mmap).
+    """
+
+    def __init__(self, store_dir: Path) -> None:
+        self.store_dir = Path(store_dir)
+        self.info = json.loads((self.store_dir / CHUNK_META).read_text(encoding="utf-8"))
+        self.offsets = np.load(self.store_dir / _OFFSETS_FILE, mmap_mode="r")
+        self.columns = {c: np.load(self.store_dir / f"{c}.npy", mmap_mode="r") for c in _COLUMNS}
+        self.sources: List[str] = json.loads((self.store_dir / _SOURCES_FILE).read_text(encoding="utf-8"))
+        self.parents: List[str] = json.loads((self.store_dir / _PARENTS_FILE).read_text(encoding="utf-8"))
+        self._file = (self.store_dir / _TEXT_FILE).open("rb")
+        # mmap no admite ficheros vacios
+        self._blob: Union[mmap.mmap, bytes] = (
+            mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.info.get("text_bytes") else b""
+        )
+        self.source_names = [s.replace("\\", "/").split("/")[-1] for s in self.sources]
+
+    def __len__(self) -> int:
+        return int(self.offsets.shape[0]) - 1
+
+    def close(self) -> None:
+        if isinstance(self._blob, mmap.mmap):
+            self._blob.close()
+        self._file.close()
+
+    # --- texto ---
+    def text_bytes(self, chunk_id: int) -> memoryview:
+        """Bytes UTF-8 del chunk, sin copiar (vista sobre el mmap)."""
+        a, b = int(self.offsets[chunk_id]), int(self.offsets[chunk_id + 1])
+        return memoryview(self._blob)[a:b]
+
+    def text(self, chunk_id: int) -> str:
+        return str(self.text_bytes(chunk_id), "utf-8")
+
+    # --- metadatos ---
+    def metadata(self, chunk_id: int) -> Dict[str, Any]:
+        src = int(self.columns["source"][chunk_id])
+        page = int(self.columns["page"][chunk_id])
+        meta: Dict[str, Any] = {
+            "chunk_id": int(chunk_id),
+            "source": self.sources[src] if src >= 0 else "",
+            "source_name": self.source_names[src] if src >= 0 else "",
+            "page": page,
+            "page_display": page + 1,
+        }
+        ingest = int(self.columns["ingest"][chunk_id])
+        if ingest:
+            meta["ingest_date"] = ingest
+        parent = int(self.columns["parent"][chunk_id])
+        if parent >= 0:
+            meta["parent_id"] = self.parents[parent]
+        return meta
+
+    def get(self, chunk_id: int) -> Document:
+        return Document(page_content=self.text(chunk_id), metadata=self.metadata(chunk_id))
+
+    # --- busqueda lexica ---
+    def grep(self, pattern: str, ignore_case: bool = True, limit: int = 50) -> List[Tuple[int, str]]:
+        """
+        Busca una expresion regular sobre el blob completo (sin decodificar chunk a chunk)
+        y devuelve [(chunk_id, fragmento)] sin repetir chunk.
+        """
+        flags = re.IGNORECASE if ignore_case else 0
+        rx = re.compile(pattern.encode("utf-8"), flags)
+        out: List[Tuple[int, str]] = []
+        last = -1
+        for m in rx.finditer(self._blob):
+            cid = int(np.searchsorted(self.offsets, m.start(), side="right")) - 1
+            if cid == last:
+                continue
+            last = cid
+            a = max(int(self.offsets[cid]), m.start() - 60)
+            b = min(int(self.offsets[cid + 1]), m.end() + 60)
+            snippet = bytes(self._blob[a:b]).decode("utf-8", errors="ignore").replace("\n", " ")
+            out.append((cid, snippet))
+            if len(out) >= limit:
+                break
+        return out
+
+
+def open_chunk_store(index_dir: Optional[Path]) -> Optional[ChunkStore]:
+    """ChunkStore del indice, o None si el indice no tiene almacen de chunks (indices antiguos)."""
+    if index_dir is None:
+        return None
+    path = chunk_store_dir(index_dir)
+    return ChunkStore(path) if (path / CHUNK_META).exists() else None
+
+
+# -------------------------
+# CLI
+# -------------------------
+def main() -> None:
+    from .config import INDEX_DIR
+    from .index import latest_index_dir, resolve_index
+
+    ap = argparse.ArgumentParser(description="Inspecciona el almacen de chunks de un indice.")
+    ap.add_argument("--index", default=None, help="carpeta o nombre del indice (por defecto el ultimo)")
+    ap.add_argument("--build", action="store_true", help="generarlo desde Chroma (indices antiguos)")
+    ap.add_argument("--grep", default=None, help="expresion regular a buscar en el texto")
+    ap.add_argument("--show", type=int, default=None, help="imprime el chunk con ese id")
+    args = ap.parse_args()
+
+    index_dir = resolve_index(args.index) if args.index else latest_index_dir(INDEX_DIR)
+    if index_dir is None:
+        raise SystemExit("No hay ningun indice disponible.")
+    if args.build:
+        chunk_store_from_chroma(index_dir)
+    store = open_chunk_store(index_dir)
+    if store is None:
+        raise SystemExit(f"{index_dir} no tiene almacen de chunks (usa --build).")
+
+    print(f"[CHUNKS] {index_dir.name}: {len(store)} chunks, {store.info['text_bytes']} bytes, "
+          f"{len(store.sources)} fuentes")
+    if args.show is not None:
+        doc = store.get(args.show)
+        print(json.dumps(doc.metadata, ensure_ascii=False))
+        print(doc.page_content)
+    if args.grep:
+        for cid, snippet in store.grep(args.grep):
+            meta = store.metadata(cid)
+            print(f"[{cid}] {meta['source_name']} (pag. {meta['page_display']}): ...{snippet}...")
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
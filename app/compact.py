@@ -0,0 +1,417 @@
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .chunkstore import ChunkStore, open_chunk_store
+from .config import COMPACT_KEEP_FULL, COMPACT_RERANK_FACTOR
+
+# -------------------------
+# Almacenamiento compacto de vectores
+# -------------------------
+# Alternativa opcional a Chroma para corpus grandes:
+#   - codes.npy   : matriz cuantizada (int8 con escala por fila, o float16), abierta con mmap
+#   - scales.npy  : escala por fila (solo int8)
+#   - full.npy    : float32 de precision completa para el re-rank, abierta con mmap: solo se
+#                   paginan las filas candidatas. Siempre en int8; en float16 solo con
+#                   COMPACT_KEEP_FULL=1 (si no, el re-rank usa codes.npy: aproximado, precision float16)
+#   - chunk_ids.npy : chunk_id de cada fila cuando el indice tiene almacen de chunks
+#                   (app.chunkstore): texto, metadatos y filtros se leen de sus columnas (mmap)
+#   - docs.jsonl  : id de cada fila (mismo orden que las matrices); sin almacen de chunks,
+#                   tambien metadatos y texto (indices antiguos)
+#   - compact_meta.json : modo, modelo de embeddings, dimension, numero de filas
+STORAGE_MODES = ("chroma", "int8", "float16")
+COMPACT_META = "compact_meta.json"
+_CODES_FILE = "codes.npy"
+_SCALES_FILE = "scales.npy"
+_FULL_FILE = "full.npy"
+_LEGACY_RERANK_FILE = "rerank.npy"  # copia float16 de re-rank de almacenes int8 anteriores
+_DOCS_FILE = "docs.jsonl"
+_CHUNK_IDS_FILE = "chunk_ids.npy"
+_SCAN_BLOCK = 65536  # filas por bloque al recorrer la matriz cuantizada
+
+
+def compact_dir(index_dir: Path, mode: str) -> Path:
+    """Subcarpeta del índice donde vive el almacenamiento compacto de un modo dado."""
+    return index_dir / f"compact_{mode}"
+
+
+def has_compact_store(index_dir: Path, mode: str) -> bool:
+    return (compact_dir(index_dir, mode) / COMPACT_META).exists()
+
+
+def _normalize_rows(mat: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _quantize(mat: np.ndarray, mode: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Cuantizacion escalar: int8 simetrico por fila (codes * scale ~= x) o float16."""
+    if mode == "float16":
+        return mat.astype(np.float16), None
+    if mode == "int8":
+        scales = np.abs(mat).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        codes = np.clip(np.rint(mat / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+    raise ValueError(f"Modo de almacenamiento compacto no soportado: {mode!r} (usa int8 o float16).")
+
+
+def write_compact_store(
+    out_dir: Path,
+    vectors: Sequence[Sequence[float]],
+    texts: Sequence[str],
+    metadatas: Sequence[Dict[str, Any]],
+    *,
+    mode: str,
+    embed_model: str,
+    ids: Optional[Sequence[str]] = None,
+    store_text: bool = True,
+    keep_full: bool = COMPACT_KEEP_FULL,
+) -> Path:
+    """
+    Escribe el almacenamiento compacto en out_dir y devuelve la ruta.
+    Tamaño en disco frente a float32: int8 0.25x + 1x de la copia float32 de re-rank (en
+    memoria residente solo la matriz recorrida, 0.25x, y las filas candidatas); float16 0.5x,
+    +1x con keep_full=True.
+    Con store_text=False ni el texto ni los metadatos se duplican en docs.jsonl: se guarda
+    el metadata['chunk_id'] de cada fila y todo se lee del almacen de chunks del indice.
+    """
+    if not (len(vectors) == len(texts) == len(metadatas)):
+        raise ValueError("vectors, texts y metadatas deben tener la misma longitud.")
+    ids = list(ids) if ids is not None else [str(uuid.uuid4()) for _ in texts]
+
+    full = _normalize_rows(np.asarray(vectors, dtype=np.float32))
+    codes, scales = _quantize(full, mode)
+
+    out_dir.mkdir(parents=True, exist_ok=True)
+    np.save(out_dir / _CODES_FILE, codes)
+    if scales is not None:
+        np.save(out_dir / _SCALES_FILE, scales)
+    if mode == "int8" or keep_full:
+        np.save(out_dir / _FULL_FILE, full)
+
+    if not store_text:
+        np.save(out_dir / _CHUNK_IDS_FILE, np.array([int(m["chunk_id"]) for m in metadatas], dtype=np.int64))
+    with (out_dir / _DOCS_FILE).open("w", encoding="utf-8") as f:
+        for doc_id, text, meta in zip(ids, texts, metadatas):
+            rec: Dict[str, Any] = {"id": doc_id}
+            if store_text:
+                rec["metadata"] = meta or {}
+                rec["text"] = text
+            f.write(json.dumps(rec, ensure_ascii=False))
+            f.write("\n")
+
+    meta_out = {
+        "mode": mode,
+        "embed_model": embed_model,
+        "dim": int(full.shape[1]) if full.ndim == 2 else 0,
+        "count": int(full.shape[0]),
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    (out_dir / COMPACT_META).write_text(json.dumps(meta_out, indent=2), encoding="utf-8")
+    print(f"[COMPACT] Guardados {len(ids)} vectores ({mode}) en {out_dir}")
+    return out_dir
+
+
+def compact_from_chroma(index_dir: Path, mode: str = "int8", embed_model: str = "") -> Path:
+    """
+    Genera el almacenamiento compacto a partir de un índice Chroma existente (sin re-embeber).
+    Se escribe en una carpeta temporal y se publica con un rename: si varios procesos lo
+    generan a la vez, gana el primero y el resto descarta su copia.
+    """
+    from langchain_community.vectorstores import Chroma
+
+    vs = Chroma(persist_directory=str(index_dir))
+    data = vs._collection.get(include=["embeddings", "documents", "metadatas"])
+    metas = [m or {} for m in data["metadatas"]]
+    # Con almacen de chunks y chunk_id en todos los metadatos no hace falta duplicar el texto
+    store_text = open_chunk_store(index_dir) is None or any("chunk_id" not in m for m in metas)
+
+    target = compact_dir(index_dir, mode)
+    tmp = target.with_name(f"{target.name}.tmp-{os.getpid()}")
+    write_compact_store(
+        tmp,
+        data["embeddings"],
+        data["documents"],
+        metas,
+        mode=mode,
+        embed_model=embed_model,
+        ids=data["ids"],
+        store_text=store_text,
+    )
+    try:
+        tmp.rename(target)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)
+        if not has_compact_store(index_dir, mode):
+            raise
+    return target
+
+
+# -------------------------
+# Evaluacion del `where` de Chroma sobre metadatos en memoria
+# -------------------------
+def _match_cond(value: Any, cond: Any) -> bool:
+    if not isinstance(cond, dict):
+        return value == cond
+    for op, arg in cond.items():
+        if op == "$eq" and not value == arg:
+            return False
+        if op == "$ne" and not value != arg:
+            return False
+        if op == "$in" and value not in arg:
+            return False
+        if op == "$nin" and value in arg:
+            return False
+        if op in ("$gt", "$gte", "$lt", "$lte"):
+            if value is None:
+                return False
+            if op == "$gt" and not value > arg:
+                return False
+            if op == "$gte" and not value >= arg:
+                return False
+            if op == "$lt" and not value < arg:
+                return False
+            if op == "$lte" and not value <= arg:
+                return False
+    return True
+
+
+def match_where(meta: Dict[str, Any], where: Optional[Dict[str, Any]]) -> bool:
+    """Subconjunto del lenguaje `where` de Chroma ($and, $or, $eq, $ne, $in, $nin, $gt(e), $lt(e))."""
+    if not where:
+        return True
+    for key, cond in where.items():
+        if key == "$and":
+            if not all(match_where(meta, c) for c in cond):
+                return False
+        elif key == "$or":
+            if not any(match_where(meta, c) for c in cond):
+                return False
+        elif not _match_cond(meta.get(key), cond):
+            return False
+    return True
+
+
+# -------------------------
+# Evaluacion vectorizada del `where` sobre las columnas del almacen de chunks
+# -------------------------
+# Mismo resultado que match_where sobre ChunkStore.metadata(i), sin crear un dict por fila:
+# las claves de texto se evaluan sobre su tabla de valores unicos y se expanden por id.
+def _cond_mask(values: np.ndarray, present: np.ndarray, cond: Any) -> np.ndarray:
+    if not isinstance(cond, dict):
+        cond = {"$eq": cond}
+    mask = np.ones(values.shape[0], dtype=bool)
+    for op, arg in cond.items():
+        if op == "$eq":
+            mask &= present & (values == arg)
+        elif op == "$ne":
+            mask &= ~present | (values != arg)
+        elif op == "$in":
+            mask &= present & np.isin(values, list(arg))
+        elif op == "$nin":
+            mask &= ~present | ~np.isin(values, list(arg))
+        elif op == "$gt":
+            mask &= present & (values > arg)
+        elif op == "$gte":
+            mask &= present & (values >= arg)
+        elif op == "$lt":
+            mask &= present & (values < arg)
+        elif op == "$lte":
+            mask &= present & (values <= arg)
+    return mask
+
+
+def _key_mask(chunks: ChunkStore, key: str, cond: Any) -> np.ndarray:
+    n = len(chunks)
+    cols = chunks.columns
+    # Claves internadas: (tabla, columna de ids, valor cuando el id es -1)
+    interned = {
+        "source": (chunks.sources, "source", ""),
+        "source_name": (chunks.source_names, "source", ""),
+        "parent_id": (chunks.parents, "parent", None),
+    }
+    if key in interned:
+        table, col, missing = interned[key]
+        lut = np.fromiter(
+            (_match_cond(v, cond) for v in [*table, missing]), dtype=bool, count=len(table) + 1
+        )
+        return lut[np.asarray(cols[col])]  # el id -1 cae en la ultima posicion (missing)
+    if key in ("page", "page_display"):
+        values = np.asarray(cols["page"], dtype=np.int64) + (1 if key == "page_display" else 0)
+        return _cond_mask(values, np.ones(n, dtype=bool), cond)
+    if key == "ingest_date":
+        values = np.asarray(cols["ingest"])
+        return _cond_mask(values, values != 0, cond)
+    if key == "chunk_id":
+        return _cond_mask(np.arange(n), np.ones(n, dtype=bool), cond)
+    return np.full(n, _match_cond(None, cond), dtype=bool)  # clave que el almacen no guarda
+
+
+def where_mask(chunks: ChunkStore, where: Dict[str, Any]) -> np.ndarray:
+    """Mascara booleana por chunk_id del `where` (mismo subconjunto que match_where)."""
+    mask = np.ones(len(chunks), dtype=bool)
+    for key, cond in where.items():
+        if key == "$and":
+            for c in cond:
+                mask &= where_mask(chunks, c)
+        elif key == "$or":
+            any_mask = np.zeros(len(chunks), dtype=bool)
+            for c in cond:
+                any_mask |= where_mask(chunks, c)
+            mask &= any_mask
+        else:
+            mask &= _key_mask(chunks, key, cond)
+    return mask
+
+
+# -------------------------
+# Vectorstore compacto (lo que usa app.fanout: busqueda por vector con su embedding)
+# -------------------------
+class CompactVectorStore:
+    """
+    Búsqueda en dos fases: producto escalar aproximado sobre la matriz cuantizada (mmap)
+    y re-rank en float32 sobre los `k * rerank_factor` mejores candidatos.
+    """
+
+    def __init__(
+        self,
+        store_dir: Path,
+        rerank_factor: int = COMPACT_RERANK_FACTOR,
+    ) -> None:
+        self.store_dir = Path(store_dir)
+        self.meta = json.loads((self.store_dir / COMPACT_META).read_text(encoding="utf-8"))
+        self.mode: str = self.meta["mode"]
+        self.rerank_factor = max(1, int(rerank_factor))
+
+        self._codes = np.load(self.store_dir / _CODES_FILE, mmap_mode="r")
+        scales_path = self.store_dir / _SCALES_FILE
+        self._scales = np.load(scales_path, mmap_mode="r") if scales_path.exists() else None
+        # Matriz de re-rank: float32 si se guardo; si no codes (float16, aproximado)
+        self._full = None
+        for name in (_FULL_FILE, _LEGACY_RERANK_FILE):
+            if (self.store_dir / name).exists():
+                self._full = np.load(self.store_dir / name, mmap_mode="r")
+                break
+
+        # Con chunk_ids.npy, texto, metadatos y filtros salen del almacen de chunks (mmap,
+        # compartido entre procesos); los ids de docs.jsonl solo se cargan si se piden
+        self._ids: Optional[List[str]] = None
+        self._texts: List[Optional[str]] = []
+        self._metas: List[Dict[str, Any]] = []
+        self._chunks: Optional[ChunkStore] = None
+        self._chunk_ids: Optional[np.ndarray] = None
+        chunk_ids_path = self.store_dir / _CHUNK_IDS_FILE
+        if chunk_ids_path.exists():
+            self._chunk_ids = np.load(chunk_ids_path, mmap_mode="r")
+        else:
+            self._ids = []
+            with (self.store_dir / _DOCS_FILE).open("r", encoding="utf-8") as f:
+                for line in f:
+                    rec = json.loads(line)
+                    self._ids.append(rec["id"])
+                    self._texts.append(rec.get("text"))
+                    self._metas.append(rec.get("metadata") or {})
+        if self._chunk_ids is not None or any(t is None for t in self._texts):
+            self._chunks = open_chunk_store(self.store_dir.parent)
+            if self._chunks is None:
+                raise RuntimeError(f"{self.store_dir} no guarda texto y el indice no tiene almacen de chunks.")
+
+    # --- utilidades ---
+    def count(self) -> int:
+        return int(self._codes.shape[0])
+
+    def _filter_mask(self, where: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        if not where:
+            return None
+        if self._chunk_ids is not None:
+            return where_mask(self._chunks, where)[self._chunk_ids]
+        return np.fromiter((match_where(m, where) for m in self._metas), dtype=bool, count=len(self._metas))
+
+    def _approx_scores(self, q: np.ndarray) -> np.ndarray:
+        n = self._codes.shape[0]
+        out = np.empty(n, dtype=np.float32)
+        for start in range(0, n, _SCAN_BLOCK):
+            end = min(start + _SCAN_BLOCK, n)
+            block = np.asarray(self._codes[start:end], dtype=np.float32)
+            out[start:end] = block @ q
+        if self._scales is not None:
+            out *= self._scales
+        return out
+
+    def _full_rows(self, rows: np.ndarray) -> np.ndarray:
+        # Lectura por filas sobre el memmap: solo se paginan los candidatos
+        src = self._full if self._full is not None else self._codes
+        mat = np.asarray(src[np.sort(rows)], dtype=np.float32)
+        order = np.argsort(np.argsort(rows))
+        mat = mat[order]
+        if self._full is None and self._scales is not None:
+            mat *= self._scales[rows][:, None]
+        return mat
+
+    def _candidates(self, q: np.ndarray, n_cand: int, where: Optional[Dict[str, Any]]) -> np.ndarray:
+        scores = self._approx_scores(q)
+        mask = self._filter_mask(where)
+        if mask is not None:
+            scores[~mask] = -np.inf
+        n_valid = int(np.isfinite(scores).sum())
+        n_cand = min(n_cand, n_valid)
+        if n_cand <= 0:
+            return np.empty(0, dtype=np.int64)
+        idx = np.argpartition(-scores, n_cand - 1)[:n_cand]
+        return idx[np.argsort(-scores[idx])]
+
+    def search_rows(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        filter: Optional[Dict[str, Any]] = None,
+        rerank: bool = True,
+    ) -> List[Tuple[int, float]]:
+        """Devuelve [(fila, similitud_coseno)] de los k mejores."""
+        q = _normalize_rows(np.asarray(embedding, dtype=np.float32)[None, :])[0]
+        n_cand = k * self.rerank_factor if rerank else k
+        cand = self._candidates(q, n_cand, filter)
+        if cand.size == 0:
+            return []
+        if rerank:
+            exact = self._full_rows(cand) @ q
+            order = np.argsort(-exact)[:k]
+            return [(int(cand[i]), float(exact[i])) for i in order]
+        approx = self._approx_scores(q)[cand]
+        return [(int(r), float(s)) for r, s in zip(cand[:k], approx[:k])]
+
+    def _doc(self, row: int) -> Document:
+        if self._chunk_ids is not None:
+            return self._chunks.get(int(self._chunk_ids[row]))
+        text = self._texts[row]
+        if text is None:
+            text = self._chunks.text(int(self._metas[row]["chunk_id"]))
+        return Document(page_content=text, metadata=dict(self._metas[row]))
+
+    def ids_for_rows(self, rows: Sequence[int]) -> List[str]:
+        if self._ids is None:
+            with (self.store_dir / _DOCS_FILE).open("r", encoding="utf-8") as f:
+                self._ids = [json.loads(line)["id"] for line in f]
+        return [self._ids[r] for r in rows]
+
+    def search_with_embeddings(
+        self, embedding: Sequence[float], k: int = 4, filter: Optional[Dict[str, Any]] = None
+    ) -> List[Tuple[Document, float, np.ndarray]]:
+        """[(doc, similitud_coseno, embedding float32)] de los k mejores (para fusionar indices)."""
+        hits = self.search_rows(embedding, k=k, filter=filter)
+        if not hits:
+            return []
+        rows = np.array([r for r, _ in hits], dtype=np.int64)
+        vecs = self._full_rows(rows)
+        return [(self._doc(r), s, vecs[i]) for i, (r, s) in enumerate(hits)]
@@ -13,6 +13,7 @@ DATA_DIR: Path = BASE_DIR / "data"
 RAW_DIR: Path = DATA_DIR / "raw"
 PROCESSED_DIR: Path = DATA_DIR / "processed"
 INDEX_DIR: Path = DATA_DIR / "index"
+CACHE_DIR: Path = DATA_DIR / "cache"
 
 # --- Carga de .env (desde la raiz del proyecto si existe) ---
 DOTENV_PATH = BASE_DIR / ".env"
@@ -24,11 +25,69 @@ else:
 
 # --- Variables y defaults de modelos ---
 OPENAI_API_KEY: str | None = os.getenv("OPENAI_API_KEY")
+# Endpoint alternativo compatible con OpenAI (p.ej. servidor falso local para pruebas de latencia)
+OPENAI_BASE_URL: str | None = os.getenv("OPENAI_BASE_URL") or None
 
 # Modelo de embeddings y chat por defecto (usados en index/rag)
 DEFAULT_EMBED_MODEL = os.getenv("DEFAULT_EMBED_MODEL", "text-embedding-3-small")
 DEFAULT_CHAT_MODEL = os.getenv("DEFAULT_CHAT_MODEL", "gpt-4.1-mini")
 
+# LLM: plazo por llamada (s), reintentos (siempre dentro del plazo) y hedging de peticiones lentas
+LLM_TIMEOUT_S = float(os.getenv("LLM_TIMEOUT_S", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "1"))
+# Embeddings de la pregunta: plazo por llamada (s) y reintentos del cliente (dentro del plazo RAG)
+EMBED_TIMEOUT_S = float(os.getenv("EMBED_TIMEOUT_S", "10"))
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", "1"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0").strip() not in ("0", "false", "no", "")
+LLM_HEDGE_PERCENTILE = float(os.getenv("LLM_HEDGE_PERCENTILE", "90"))
+LLM_HEDGE_MIN_DELAY_S = float(os.getenv("LLM_HEDGE_MIN_DELAY_S", "0.5"))
+LLM_HEDGE_DEFAULT_DELAY_S = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_S", "2.0"))
+
+# Almacenamiento de vectores: "chroma" (por defecto) o compacto "int8" / "float16"
+INDEX_STORAGE = os.getenv("INDEX_STORAGE", "chroma").strip().lower()
+# Candidatos por cada resultado final que se re-rankean en float32 (modo compacto)
+COMPACT_RERANK_FACTOR = int(os.getenv("COMPACT_RERANK_FACTOR", "4"))
+# En modo float16, guardar tambien la copia float32 para re-rankear a precision completa (1/0);
+# el modo int8 la guarda siempre
+COMPACT_KEEP_FULL = os.getenv("COMPACT_KEEP_FULL", "0").strip() not in ("0", "false", "no", "")
+
+# Modo de solo lectura para varios procesos: se sirve desde el almacenamiento compacto (mmap,
+# compartido via cache de paginas del SO) en lugar de abrir Chroma en cada proceso (1/0)
+INDEX_READ_ONLY = os.getenv("INDEX_READ_ONLY", "0").strip() not in ("0", "false", "no", "")
+READ_ONLY_STORAGE = os.getenv("READ_ONLY_STORAGE", "float16").strip().lower()
+
+# Indice padre-hijo: hijos recuperados por cada padre pedido y presupuesto de contexto (caracteres)
+PARENT_CHILD_FANOUT = int(os.getenv("PARENT_CHILD_FANOUT", "3"))
+PARENT_CONTEXT_CHARS = int(os.getenv("PARENT_CONTEXT_CHARS", "8000"))
+# Tamaño maximo de una unidad padre (caracteres): las mas largas se parten al indexar
+PARENT_MAX_CHARS = int(os.getenv("PARENT_MAX_CHARS", "4000"))
+
+# Recuperacion en abanico: hilos para consultar varios indices y lista por defecto (separada por comas).
+# Un shard que no responde a tiempo sigue ocupando su hilo hasta terminar (no se puede interrumpir),
+# por eso el pool por defecto deja margen sobre los nucleos
+FANOUT_WORKERS = int(os.getenv("FANOUT_WORKERS", str(min(32, (os.cpu_count() or 4) + 4))))
+RETRIEVAL_INDICES = [s.strip() for s in os.getenv("RETRIEVAL_INDICES", "").split(",") if s.strip()]
+
+# Consultas RAG: presupuesto total por consulta (s), consultas simultaneas, cola de espera
+# acotada y espera maxima en cola antes de rechazar; por debajo de RAG_MIN_LLM_S restantes
+# no se llama al LLM y se devuelven solo las fuentes
+RAG_DEADLINE_S = float(os.getenv("RAG_DEADLINE_S", "45"))
+RAG_MAX_INFLIGHT = int(os.getenv("RAG_MAX_INFLIGHT", "8"))
+RAG_MAX_QUEUE = int(os.getenv("RAG_MAX_QUEUE", "16"))
+RAG_QUEUE_TIMEOUT_S = float(os.getenv("RAG_QUEUE_TIMEOUT_S", "5"))
+RAG_MIN_LLM_S = float(os.getenv("RAG_MIN_LLM_S", "2"))
+# Hilos para peticiones al LLM: hasta dos (principal + respaldo) por consulta admitida
+LLM_WORKERS = int(os.getenv("LLM_WORKERS", str(2 * max(1, RAG_MAX_INFLIGHT))))
+# Umbral de confianza: si la mejor similitud coseno recuperada queda por debajo, no se llama
+# al LLM y se responde "sin datos" (vacio = desactivado; calibrar con eval/metricas.py)
+_min_score = os.getenv("RAG_MIN_SCORE", "").strip()
+RAG_MIN_SCORE: float | None = float(_min_score) if _min_score else None
+
+# Cache de embeddings de consulta: entradas LRU en memoria y persistencia en disco (1/0)
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_DISK = os.getenv("QUERY_CACHE_DISK", "1").strip() not in ("0", "false", "no", "")
+QUERY_CACHE_DIR: Path = CACHE_DIR
+
 
 def _ensure_dirs(paths: Iterable[Path]) -> None:
     """Crea directorios si no existen (idempotente)."""
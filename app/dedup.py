@@ -0,0 +1,205 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import unicodedata
+import zlib
+from collections import Counter, defaultdict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .config import PROCESSED_DIR
+
+# -------------------------
+# Parametros (por defecto pensados para boletines tipo BOCM)
+# -------------------------
+EDGE_LINES = 4            # lineas al principio/final de pagina candidatas a cabecera/pie
+MIN_REPEAT_RATIO = 0.5    # fraccion minima de paginas en las que debe repetirse la linea
+MIN_REPEAT_PAGES = 3      # y numero minimo absoluto de paginas
+MAX_EDGE_LINE_CHARS = 120  # las cabeceras/pies son cortos; lineas mas largas nunca se quitan
+SHINGLE_WORDS = 5         # tamaño de shingle (palabras) para MinHash
+NUM_PERM = 64             # permutaciones MinHash
+LSH_BANDS = 16            # bandas LSH (NUM_PERM / LSH_BANDS filas por banda)
+NEAR_DUP_THRESHOLD = 0.85  # Jaccard estimado a partir del cual un chunk se considera casi duplicado
+
+_MERSENNE = (1 << 31) - 1
+_DIGITS = re.compile(r"\d+")
+
+
+def _norm_text(text: str) -> str:
+    return " ".join(unicodedata.normalize("NFKC", text or "").lower().split())
+
+
+def _line_key(line: str) -> str:
+    """Clave de linea: normalizada y con los numeros enmascarados (pagina, codigos de verificacion...)."""
+    norm = _norm_text(line)
+    if len(norm) > MAX_EDGE_LINE_CHARS:
+        return ""
+    return _DIGITS.sub("#", norm)
+
+
+# -------------------------
+# 1) Cabeceras y pies repetidos por documento
+# -------------------------
+def strip_repeated_lines(pages: List[Document]) -> Tuple[List[Document], int]:
+    """
+    Elimina de cada pagina las lineas de cabecera/pie que se repiten en la mayoria de
+    paginas del mismo documento. `pages` son las paginas de UN PDF. Devuelve (paginas, lineas_quitadas).
+    """
+    if len(pages) < MIN_REPEAT_PAGES:
+        return pages, 0
+
+    counts: Counter = Counter()
+    for doc in pages:
+        lines = [ln for ln in doc.page_content.splitlines() if ln.strip()]
+        edge = lines[:EDGE_LINES] + lines[-EDGE_LINES:]
+        counts.update({_line_key(ln) for ln in edge})
+
+    min_pages = max(MIN_REPEAT_PAGES, int(len(pages) * MIN_REPEAT_RATIO))
+    repeated = {key for key, n in counts.items() if n >= min_pages and key}
+    if not repeated:
+        return pages, 0
+
+    removed = 0
+    out: List[Document] = []
+    for doc in pages:
+        lines = doc.page_content.splitlines()
+        non_empty = [i for i, ln in enumerate(lines) if ln.strip()]
+        edge_idx = set(non_empty[:EDGE_LINES] + non_empty[-EDGE_LINES:])
+        kept = []
+        for i, ln in enumerate(lines):
+            if i in edge_idx and _line_key(ln) in repeated:
+                removed += 1
+                continue
+            kept.append(ln)
+        out.append(Document(page_content="\n".join(kept), metadata=doc.metadata))
+    return out, removed
+
+
+def strip_boilerplate(documents: List[Document]) -> Tuple[List[Document], Dict[str, Any]]:
+    """Aplica strip_repeated_lines por documento (agrupando paginas por metadata['source'])."""
+    by_source: Dict[str, List[int]] = defaultdict(list)
+    for i, doc in enumerate(documents):
+        by_source[str((doc.metadata or {}).get("source", ""))].append(i)
+
+    out = list(documents)
+    per_source: Dict[str, int] = {}
+    for source, idxs in by_source.items():
+        cleaned, removed = strip_repeated_lines([documents[i] for i in idxs])
+        for i, doc in zip(idxs, cleaned):
+            out[i] = doc
+        if removed:
+            per_source[source.replace("\\", "/").split("/")[-1]] = removed
+    return out, {"lineas_cabecera_pie_quitadas": sum(per_source.values()), "por_documento": per_source}
+
+
+# -------------------------
+# 2) Chunks duplicados exactos y casi duplicados (MinHash + LSH)
+# -------------------------
+_rng = np.random.default_rng(1234)
+_PERM_A = _rng.integers(1, _MERSENNE, size=NUM_PERM, dtype=np.int64)
+_PERM_B = _rng.integers(0, _MERSENNE, size=NUM_PERM, dtype=np.int64)
+
+
+def _shingles(text: str) -> np.ndarray:
+    words = _norm_text(text).split()
+    if len(words) < SHINGLE_WORDS:
+        grams = [" ".join(words)] if words else []
+    else:
+        grams = [" ".join(words[i : i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)]
+    # crc32 & 0x7fffffff < 2^31: el producto a*x cabe en int64
+    return np.fromiter(
+        (zlib.crc32(g.encode("utf-8")) & 0x7FFFFFFF for g in set(grams)), dtype=np.int64
+    )
+
+
+def minhash_signature(text: str) -> np.ndarray:
+    sh = _shingles(text)
+    if sh.size == 0:
+        return np.full(NUM_PERM, _MERSENNE, dtype=np.int64)
+    return ((np.outer(_PERM_A, sh) + _PERM_B[:, None]) % _MERSENNE).min(axis=1)
+
+
+def remove_duplicate_chunks(
+    chunks: List[Document],
+    threshold: float = NEAR_DUP_THRESHOLD,
+) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Quita chunks exactamente duplicados (hash del texto normalizado) y casi duplicados
+    (MinHash con LSH por bandas; se confirma con el Jaccard estimado >= threshold).
+    Solo se comparan chunks del mismo documento (metadata['source']): un texto repetido
+    en dos PDFs se conserva en ambos para que los filtros por documento y las citas
+    sigan encontrandolo. Conserva la primera aparicion. Devuelve (chunks, informe).
+    """
+    rows = NUM_PERM // LSH_BANDS
+    seen_exact: Dict[Tuple[str, str], int] = {}
+    buckets: Dict[Tuple[str, int, bytes], List[int]] = defaultdict(list)
+    kept_sigs: List[np.ndarray] = []
+    kept: List[Document] = []
+    exact = near = empty = 0
+    ejemplos: List[Dict[str, Any]] = []
+
+    for doc in chunks:
+        source = str((doc.metadata or {}).get("source", ""))
+        norm = _norm_text(doc.page_content)
+        h = (source, hashlib.sha1(norm.encode("utf-8")).hexdigest())
+        if not norm:
+            empty += 1
+            continue
+        if h in seen_exact:
+            exact += 1
+            continue
+
+        sig = minhash_signature(norm)
+        band_keys = [(source, b, sig[b * rows : (b + 1) * rows].tobytes()) for b in range(LSH_BANDS)]
+        candidates = {j for key in band_keys for j in buckets.get(key, ())}
+        dup_of = next(
+            (j for j in sorted(candidates) if float(np.mean(kept_sigs[j] == sig)) >= threshold),
+            None,
+        )
+        if dup_of is not None:
+            near += 1
+            if len(ejemplos) < 20:
+                ejemplos.append({
+                    "quitado": _chunk_ref(doc),
+                    "duplicado_de": _chunk_ref(kept[dup_of]),
+                })
+            continue
+
+        pos = len(kept)
+        seen_exact[h] = pos
+        for key in band_keys:
+            buckets[key].append(pos)
+        kept_sigs.append(sig)
+        kept.append(doc)
+
+    report = {
+        "chunks_entrada": len(chunks),
+        "duplicados_exactos": exact,
+        "casi_duplicados": near,
+        "vacios": empty,
+        "chunks_salida": len(kept),
+        "umbral_jaccard": threshold,
+        "ambito": "por_documento",
+        "ejemplos": ejemplos,
+    }
+    return kept, report
+
+
+def _chunk_ref(doc: Document) -> str:
+    meta = doc.metadata or {}
+    name = str(meta.get("source_name") or meta.get("source", "desconocido")).replace("\\", "/").split("/")[-1]
+    return f"{name} (pag. {meta.get('page_display', '?')})"
+
+
+def save_dedup_report(report: Dict[str, Any], output_path: Optional[Path] = None) -> Path:
+    """Guarda el informe de limpieza en data/processed/dedup_report.json."""
+    if output_path is None:
+        output_path = PROCESSED_DIR / "dedup_report.json"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    output_path.write_text(json.dumps(report, indent=2, ensure_ascii=False), encoding="utf-8")
+    return output_path
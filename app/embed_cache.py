@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import hashlib
+import sqlite3
+import threading
+import unicodedata
+from array import array
+from collections import OrderedDict
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_openai import OpenAIEmbeddings
+
+from .config import (
+    OPENAI_API_KEY,
+    DEFAULT_EMBED_MODEL,
+    EMBED_MAX_RETRIES,
+    EMBED_TIMEOUT_S,
+    QUERY_CACHE_DIR,
+    QUERY_CACHE_DISK,
+    QUERY_CACHE_SIZE,
+)
+
+
+# -------------------------
+# Cache de embeddings de consulta (LRU en memoria + SQLite en disco)
+# -------------------------
+def normalize_query(text: str) -> str:
+    """Normaliza la consulta para la clave de cache: NFC + espacios colapsados."""
+    return " ".join(unicodedata.normalize("NFC", text or "").split())
+
+
+def _cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\x00{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Envuelve un `Embeddings` y cachea `embed_query` por (modelo, texto normalizado).
+    `embed_documents` pasa directo (se usa solo al indexar).
+    """
+
+    def __init__(
+        self,
+        inner: Embeddings,
+        model: str,
+        max_items: int = QUERY_CACHE_SIZE,
+        disk_path: Optional[Path] = None,
+    ) -> None:
+        self.inner = inner
+        self.model = model
+        self.max_items = max(0, int(max_items))
+        self.disk_path = disk_path
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats: Dict[str, int] = {"hits_memory": 0, "hits_disk": 0, "misses": 0}
+        if disk_path is not None:
+            disk_path.parent.mkdir(parents=True, exist_ok=True)
+            with closing(self._connect()) as con, con:
+                con.execute(
+                    "CREATE TABLE IF NOT EXISTS query_embeddings "
+                    "(key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL)"
+                )
+
+    # --- disco ---
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.disk_path), timeout=5.0)
+
+    def _disk_get(self, key: str) -> Optional[List[float]]:
+        if self.disk_path is None:
+            return None
+        try:
+            with closing(self._connect()) as con:
+                row = con.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        vec = array("f")
+        vec.frombytes(row[0])
+        return vec.tolist()
+
+    def _disk_put(self, key: str, vector: List[float]) -> None:
+        if self.disk_path is None:
+            return
+        try:
+            with closing(self._connect()) as con, con:
+                con.execute(
+                    "INSERT OR REPLACE INTO query_embeddings (key, model, vector) VALUES (?, ?, ?)",
+                    (key, self.model, array("f", vector).tobytes()),
+                )
+        except sqlite3.Error as e:
+            print(f"[CACHE] No se pudo guardar el embedding en disco: {e}")
+
+    # --- memoria ---
+    def _mem_put(self, key: str, vector: List[float]) -> None:
+        if self.max_items == 0:
+            return
+        with self._lock:
+            self._lru[key] = vector
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_items:
+                self._lru.popitem(last=False)
+
+    # --- API Embeddings ---
+    def embed_query(self, text: str) -> List[float]:
+        key = _cache_key(self.model, text)
+        with self._lock:
+            vec = self._lru.get(key)
+            if vec is not None:
+                self._lru.move_to_end(key)
+                self.stats["hits_memory"] += 1
+                return list(vec)
+
+        vec = self._disk_get(key)
+        if vec is not None:
+            with self._lock:
+                self.stats["hits_disk"] += 1
+            self._mem_put(key, vec)
+            return list(vec)
+
+        with self._lock:
+            self.stats["misses"] += 1
+        vec = list(self.inner.embed_query(normalize_query(text)))
+        self._mem_put(key, vec)
+        self._disk_put(key, vec)
+        return list(vec)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.inner.embed_documents(texts)
+
+    def cache_info(self) -> Dict[str, int]:
+        with self._lock:
+            info = dict(self.stats)
+            info["size_memory"] = len(self._lru)
+        return info
+
+    def clear_memory(self) -> None:
+        with self._lock:
+            self._lru.clear()
+
+
+# Una instancia compartida por modelo: la cache sobrevive entre llamadas a load_vectorstore
+_SHARED: Dict[str, CachedQueryEmbeddings] = {}
+_SHARED_LOCK = threading.Lock()
+
+
+def get_query_embeddings(model: str = DEFAULT_EMBED_MODEL) -> CachedQueryEmbeddings:
+    """Devuelve los embeddings OpenAI del modelo con la cache de consultas compartida."""
+    with _SHARED_LOCK:
+        emb = _SHARED.get(model)
+        if emb is None:
+            if OPENAI_API_KEY is None or OPENAI_API_KEY.strip() == "":
+                raise RuntimeError("OPENAI_API_KEY no está configurada. Revisa el archivo .env.")
+            disk = QUERY_CACHE_DIR / "query_embeddings.sqlite3" if QUERY_CACHE_DISK else None
+            emb = CachedQueryEmbeddings(
+                OpenAIEmbeddings(
+                    api_key=OPENAI_API_KEY,
+                    model=model,
+                    timeout=EMBED_TIMEOUT_S,
+                    max_retries=EMBED_MAX_RETRIES,
+                ),
+                model=model,
+                disk_path=disk,
+            )
+            _SHARED[model] = emb
+        return emb
+
+
+def cache_stats() -> Dict[str, Dict[str, int]]:
+    """Contadores de aciertos/fallos por modelo (para instrumentacion)."""
+    with _SHARED_LOCK:
+        return {m: e.cache_info() for m, e in _SHARED.items()}
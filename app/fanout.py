@@ -0,0 +1,178 @@
+from __future__ import annotations
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+from .config import (
+    DEFAULT_EMBED_MODEL,
+    FANOUT_WORKERS,
+    PARENT_CHILD_FANOUT,
+    PARENT_CONTEXT_CHARS,
+    RAG_MAX_INFLIGHT,
+)
+from .admission import hold_slot
+from .compact import CompactVectorStore
+from .embed_cache import get_query_embeddings
+from .index import load_vectorstore, read_manifest, resolve_index
+from .parents import ParentStore, collapse_multi, open_parent_store
+
+# -------------------------
+# Recuperacion en abanico sobre varios indices (shards)
+# -------------------------
+# La pregunta se embebe UNA vez; cada shard se consulta en paralelo y devuelve
+# (doc, similitud_coseno, embedding). Las puntuaciones se normalizan a coseno para que
+# sean comparables entre shards (Chroma "l2" guarda la distancia L2 al cuadrado).
+Candidate = Tuple[Document, float, np.ndarray]
+
+# Limite: un hilo de Python no se puede interrumpir, asi que fut.cancel() solo evita que
+# arranquen las tareas en cola; un shard lento sigue ocupando su hilo tras el plazo hasta que
+# termina, y su consulta sigue ocupando el hueco de admision hasta entonces (hold_slot).
+# FANOUT_WORKERS deja margen para esos rezagados (ver app.config).
+_EXECUTOR = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="fanout")
+# Pool aparte para el embedding de la pregunta: no compite con los shards por hilos. Como las
+# tareas que siguen en marcha retienen el hueco de admision (hold_slot), basta un hilo por consulta
+_EMBED_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, RAG_MAX_INFLIGHT), thread_name_prefix="embed")
+
+
+class RetrievalTimeoutError(TimeoutError):
+    """No ha dado tiempo a embeber la pregunta dentro del plazo de la consulta."""
+
+
+def _distance_to_cosine(distance: float, space: str) -> float:
+    """Distancia de Chroma -> similitud coseno (embeddings OpenAI normalizados)."""
+    if space == "l2":
+        return 1.0 - float(distance) / 2.0
+    return 1.0 - float(distance)  # "cosine" e "ip" devuelven 1 - producto
+
+
+def _chroma_candidates(vs: Any, qvec: Sequence[float], n: int, where: Optional[Dict[str, Any]]) -> List[Candidate]:
+    count = vs._collection.count()
+    n = min(n, count)
+    if n <= 0:
+        return []
+    res = vs._collection.query(
+        query_embeddings=[list(qvec)],
+        n_results=n,
+        where=where or None,
+        include=["documents", "metadatas", "distances", "embeddings"],
+    )
+    space = (vs._collection.metadata or {}).get("hnsw:space", "l2")
+    out: List[Candidate] = []
+    for text, meta, dist, emb in zip(
+        res["documents"][0], res["metadatas"][0], res["distances"][0], res["embeddings"][0]
+    ):
+        doc = Document(page_content=text or "", metadata=dict(meta or {}))
+        out.append((doc, _distance_to_cosine(dist, space), np.asarray(emb, dtype=np.float32)))
+    return out
+
+
+def shard_candidates(
+    index_dir: Path, qvec: Sequence[float], n: int, where: Optional[Dict[str, Any]] = None
+) -> List[Candidate]:
+    """Top-n de un shard con similitud coseno y embedding; metadata['index'] = nombre del shard."""
+    vs = load_vectorstore(index_dir)
+    if isinstance(vs, CompactVectorStore):
+        cands = vs.search_with_embeddings(qvec, k=n, filter=where)
+    else:
+        cands = _chroma_candidates(vs, qvec, n, where)
+    for doc, score, _ in cands:
+        doc.metadata["index"] = index_dir.name
+        doc.metadata["score"] = round(score, 4)
+    return cands
+
+
+def fanout_search(
+    question: str,
+    indices: Sequence[Union[str, Path]],
+    *,
+    k: int = 4,
+    use_mmr: bool = False,
+    fetch_k: Optional[int] = None,
+    lambda_mult: float = 0.5,
+    where: Optional[Dict[str, Any]] = None,
+    deadline_s: Optional[float] = None,
+    report: Optional[Dict[str, Any]] = None,
+) -> List[Document]:
+    """
+    Consulta varios índices en paralelo y devuelve un top-k global:
+      - similitud: orden por coseno fusionado
+      - MMR: MMR sobre la unión de los fetch_k mejores candidatos de todos los shards
+    Los shards padre-hijo devuelven sus padres (ver app.parents.collapse_multi).
+    deadline_s cubre tambien el embedding de la pregunta (RetrievalTimeoutError si se agota
+    ahi). Un shard que falla, o que no responde en el tiempo restante, se registra y se
+    ignora (resultado parcial); si fallan todos se propaga el error.
+    Si se pasa `report` (dict) se rellena con los shards consultados, los que no
+    respondieron a tiempo ("timed_out") y los que fallaron ("failed").
+    """
+    dirs = [resolve_index(i) for i in indices]
+    models = {read_manifest(d).get("embed_model") or DEFAULT_EMBED_MODEL for d in dirs}
+    if len(models) > 1:
+        raise RuntimeError(f"Los índices usan modelos de embeddings distintos: {sorted(models)}")
+    t0 = time.monotonic()
+    embed_fut = _EMBED_EXECUTOR.submit(get_query_embeddings(models.pop()).embed_query, question)
+    hold_slot(embed_fut)
+    try:
+        qvec = embed_fut.result(timeout=deadline_s)
+    except FutureTimeout:
+        embed_fut.cancel()
+        if report is not None:
+            report.update({"shards": len(dirs), "timed_out": [d.name for d in dirs], "failed": []})
+        raise RetrievalTimeoutError(f"El embedding de la pregunta no termino en {deadline_s:.1f} s.")
+    if deadline_s is not None:
+        deadline_s = max(0.0, deadline_s - (time.monotonic() - t0))
+
+    stores: Dict[str, ParentStore] = {}
+    for d in dirs:
+        store = open_parent_store(d)
+        if store is not None:
+            stores[d.name] = store
+    n_final = k * max(1, PARENT_CHILD_FANOUT) if stores else k
+    n_shard = max(fetch_k or max(8, k * 2), n_final) if use_mmr else n_final
+
+    futures = {d.name: _EXECUTOR.submit(shard_candidates, d, qvec, n_shard, where) for d in dirs}
+    for fut in futures.values():
+        hold_slot(fut)
+    wait(futures.values(), timeout=deadline_s)
+    merged: List[Candidate] = []
+    errors: List[Exception] = []
+    timed_out: List[str] = []
+    failed: List[str] = []
+    for name, fut in futures.items():
+        if not fut.done():
+            fut.cancel()
+            timed_out.append(name)
+            print(f"[FANOUT] {name} no ha respondido a tiempo; se omite.")
+            continue
+        try:
+            merged.extend(fut.result())
+        except Exception as e:
+            errors.append(e)
+            failed.append(name)
+            print(f"[FANOUT] Error consultando {name}: {e}")
+    if report is not None:
+        report.update({"shards": len(futures), "timed_out": timed_out, "failed": failed})
+    if errors and len(errors) == len(futures):
+        raise errors[0]  # ningun shard ha respondido: no es un resultado parcial
+    merged.sort(key=lambda c: c[1], reverse=True)
+
+    if use_mmr and merged:
+        pool = merged[:n_shard]
+        picked = maximal_marginal_relevance(
+            np.asarray(qvec, dtype=np.float32),
+            [emb for _, _, emb in pool],
+            k=min(n_final, len(pool)),
+            lambda_mult=lambda_mult,
+        )
+        selected = [pool[i][0] for i in picked]
+    else:
+        selected = [doc for doc, _, _ in merged[:n_final]]
+
+    if stores:
+        return collapse_multi(selected, stores, k=k, budget_chars=PARENT_CONTEXT_CHARS)
+    return selected[:k]
@@ -1,22 +1,78 @@
 from __future__ import annotations
 
+import json
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, List, Tuple
+from typing import Any, Dict, Optional, List, Tuple, Union
 
 from langchain_openai import OpenAIEmbeddings
 from langchain_community.vectorstores import Chroma  # si migras: from langchain_chroma import Chroma
 
-from .config import INDEX_DIR, OPENAI_API_KEY, DEFAULT_EMBED_MODEL, check_config
-from .ingest import load_pdf_documents, split_documents
+from .config import (
+    INDEX_DIR,
+    OPENAI_API_KEY,
+    DEFAULT_EMBED_MODEL,
+    INDEX_STORAGE,
+    INDEX_READ_ONLY,
+    PARENT_MAX_CHARS,
+    READ_ONLY_STORAGE,
+    check_config,
+)
+from .ingest import (
+    CHUNK_SIZE,
+    CHUNK_OVERLAP,
+    CHILD_CHUNK_SIZE,
+    CHILD_CHUNK_OVERLAP,
+    INGEST_DEDUP,
+    PARENT_UNIT,
+    load_pdf_documents,
+    prepare_chunks,
+    prepare_parent_child,
+)
+from .parents import PARENT_STORE_FILE, ParentStore
+from .chunkstore import write_chunk_store
+from .embed_cache import get_query_embeddings
+from .compact import (
+    STORAGE_MODES,
+    CompactVectorStore,
+    compact_dir,
+    compact_from_chroma,
+    has_compact_store,
+    write_compact_store,
+)
 
 
 # -------------------------
 # Helpers de gestión de índices versionados
 # -------------------------
+INDEX_MANIFEST = "index_manifest.json"
+
+
 def _new_index_dir(base: Path) -> Path:
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    return base / f"index_{ts}"
+    target = base / f"index_{ts}"
+    # Dos builds en el mismo segundo (p.ej. barridos): sufijo que mantiene el orden por nombre
+    n = 1
+    while target.exists():
+        target = base / f"index_{ts}_{n}"
+        n += 1
+    return target
+
+
+def _write_manifest(index_dir: Path, info: Dict[str, Any]) -> None:
+    (index_dir / INDEX_MANIFEST).write_text(json.dumps(info, indent=2), encoding="utf-8")
+
+
+def read_manifest(index_dir: Path) -> Dict[str, Any]:
+    """Lee index_manifest.json (parámetros de construcción). {} si el índice es antiguo."""
+    p = index_dir / INDEX_MANIFEST
+    if not p.exists():
+        return {}
+    try:
+        return json.loads(p.read_text(encoding="utf-8"))
+    except Exception:
+        return {}
 
 
 def list_indices(base: Path = INDEX_DIR) -> List[Path]:
@@ -33,18 +89,52 @@ def latest_index_dir(base: Path = INDEX_DIR) -> Optional[Path]:
     return indices[-1] if indices else None
 
 
+def resolve_index(ref: Union[str, Path], base: Path = INDEX_DIR) -> Path:
+    """Acepta una ruta o un nombre de carpeta (index_...) dentro de INDEX_DIR."""
+    p = Path(ref)
+    if not p.is_absolute() and not p.exists():
+        p = base / p
+    if not p.is_dir():
+        raise RuntimeError(f"No existe el índice {ref}.")
+    return p
+
+
+def find_index(base: Path = INDEX_DIR, **params: Any) -> Optional[Path]:
+    """Índice más reciente cuyo manifest coincide con los parámetros dados (p.ej. chunk_size=800)."""
+    for idx in reversed(list_indices(base)):
+        manifest = read_manifest(idx)
+        if manifest and all(manifest.get(k) == v for k, v in params.items()):
+            return idx
+    return None
+
+
 # -------------------------
 # Build / Load
 # -------------------------
 def build_index(
     persist_dir: Optional[Path] = None,
     embed_model: str = DEFAULT_EMBED_MODEL,
+    storage: str = INDEX_STORAGE,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    dedup: bool = INGEST_DEDUP,
+    parent_unit: str = PARENT_UNIT,
+    child_chunk_size: int = CHILD_CHUNK_SIZE,
+    child_chunk_overlap: int = CHILD_CHUNK_OVERLAP,
 ) -> Path:
     """
     Crea un NUEVO índice en una carpeta versionada (no borra el anterior).
+    Con storage="int8"/"float16" se guarda solo el almacenamiento compacto (sin Chroma).
+    Con parent_unit="page"/"article" se embeben chunks hijos pequeños y las unidades
+    padre se guardan en parents.sqlite3 (ver app.parents).
+    El texto y los metadatos de los chunks se guardan además en chunks/ (ver app.chunkstore)
+    y cada chunk lleva metadata['chunk_id'] = su posición en ese almacén.
+    Los parámetros de construcción quedan en index_manifest.json.
     Devuelve la ruta del nuevo índice.
     """
     check_config()
+    if storage not in STORAGE_MODES:
+        raise ValueError(f"storage debe ser uno de {STORAGE_MODES}, no {storage!r}.")
 
     base_dir = INDEX_DIR
     base_dir.mkdir(parents=True, exist_ok=True)
@@ -57,7 +147,19 @@ def build_index(
         return target_dir
 
     print("[INDEX] Dividiendo documentos en chunks...")
-    chunks = split_documents(documents)
+    parents = []
+    if parent_unit:
+        parents, chunks, dedup_report = prepare_parent_child(
+            documents,
+            parent_unit=parent_unit,
+            child_size=child_chunk_size,
+            child_overlap=child_chunk_overlap,
+            dedup=dedup,
+        )
+    else:
+        chunks, dedup_report = prepare_chunks(
+            documents, chunk_size=chunk_size, chunk_overlap=chunk_overlap, dedup=dedup
+        )
     if not chunks:
         print("[INDEX] No se han generado chunks. Abortando indexado.")
         return target_dir
@@ -69,6 +171,47 @@ def build_index(
     embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=embed_model)
 
     target_dir.mkdir(parents=True, exist_ok=True)
+    for i, c in enumerate(chunks):
+        c.metadata["chunk_id"] = i
+    write_chunk_store(target_dir, [c.page_content for c in chunks], [c.metadata for c in chunks])
+
+    manifest = {
+        "embed_model": embed_model,
+        "storage": storage,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "n_documents": len(documents),
+        "n_chunks": len(chunks),
+        "dedup": dedup,
+        "dedup_removed": dedup_report.get("chunks_entrada", len(chunks)) - len(chunks),
+        "parent_unit": parent_unit or None,
+        "n_parents": len(parents),
+        "child_chunk_size": child_chunk_size if parent_unit else None,
+        "child_chunk_overlap": child_chunk_overlap if parent_unit else None,
+        "parent_max_chars": PARENT_MAX_CHARS if parent_unit else None,
+        "chunk_store": True,
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    if parents:
+        ParentStore(target_dir / PARENT_STORE_FILE).write(parents)
+        print(f"[INDEX] Guardadas {len(parents)} unidades padre ({parent_unit}) en {PARENT_STORE_FILE}")
+
+    if storage != "chroma":
+        print(f"[INDEX] Construyendo almacenamiento compacto ({storage}) en {target_dir} ...")
+        vectors = embeddings.embed_documents([c.page_content for c in chunks])
+        write_compact_store(
+            compact_dir(target_dir, storage),
+            vectors,
+            [c.page_content for c in chunks],
+            [c.metadata for c in chunks],
+            mode=storage,
+            embed_model=embed_model,
+            store_text=False,
+        )
+        _write_manifest(target_dir, manifest)
+        print("[INDEX] Indexado completado:", target_dir)
+        return target_dir
+
     print(f"[INDEX] Construyendo vectorstore Chroma en {target_dir} ...")
 
     # En chromadb 0.5+ la persistencia es automática al usar persist_directory
@@ -77,17 +220,73 @@ def build_index(
         embedding=embeddings,
         persist_directory=str(target_dir),
     )
+    _write_manifest(target_dir, manifest)
 
     print("[INDEX] Indexado completado:", target_dir)
     return target_dir
 
 
+def _has_chroma(persist_dir: Path) -> bool:
+    return (persist_dir / "chroma.sqlite3").exists()
+
+
+def _pick_compact_mode(persist_dir: Path, storage: str) -> Optional[str]:
+    """Modo compacto a usar: el pedido si existe; si no hay Chroma, cualquiera disponible."""
+    if storage != "chroma" and has_compact_store(persist_dir, storage):
+        return storage
+    if not _has_chroma(persist_dir):
+        for mode in STORAGE_MODES[1:]:
+            if has_compact_store(persist_dir, mode):
+                return mode
+    return None
+
+
+# Almacenamientos compactos ya abiertos en este proceso: (carpeta, modo, modelo) -> store.
+# Las versiones de índice no cambian, así que abrirlos una vez evita re-leer docs.jsonl por consulta.
+_COMPACT_STORES: Dict[Tuple[str, str, str], CompactVectorStore] = {}
+_COMPACT_LOCK = threading.Lock()
+
+
+def _open_compact(persist_dir: Path, mode: str, embed_model: str, create: bool = False) -> CompactVectorStore:
+    """Store compacto cacheado por (carpeta, modo, modelo); con create=True se genera desde Chroma si falta."""
+    key = (str(persist_dir.resolve()), mode, embed_model)
+    with _COMPACT_LOCK:
+        cvs = _COMPACT_STORES.get(key)
+        if cvs is not None:
+            return cvs
+        if create and not has_compact_store(persist_dir, mode):
+            print(f"[INDEX] Generando almacenamiento compacto ({mode}) para servir en solo lectura...")
+            compact_from_chroma(persist_dir, mode=mode, embed_model=embed_model)
+        print(f"[INDEX] Cargando almacenamiento compacto ({mode}, mmap) desde {persist_dir} ...")
+        cvs = CompactVectorStore(compact_dir(persist_dir, mode))
+        _COMPACT_STORES[key] = cvs
+        return cvs
+
+
+def _load_read_only(persist_dir: Path, embed_model: str, storage: str) -> CompactVectorStore:
+    """
+    Abre el índice en solo lectura desde su almacenamiento compacto: las matrices y el texto
+    de los chunks se mapean en memoria, así que N procesos comparten las mismas páginas
+    del SO en lugar de cargar N copias del HNSW de Chroma. Si el índice solo tiene Chroma,
+    el almacenamiento compacto se genera una vez (sin re-embeber) y se reutiliza.
+    """
+    mode = _pick_compact_mode(persist_dir, storage)
+    if mode is None:
+        mode = storage if storage in STORAGE_MODES[1:] else READ_ONLY_STORAGE
+    return _open_compact(persist_dir, mode, embed_model, create=True)
+
+
 def load_vectorstore(
     persist_dir: Optional[Path] = None,
     embed_model: str = DEFAULT_EMBED_MODEL,
-) -> Chroma:
+    storage: str = INDEX_STORAGE,
+    read_only: bool = INDEX_READ_ONLY,
+) -> Union[Chroma, CompactVectorStore]:
     """
     Carga el índice MÁS RECIENTE de INDEX_DIR si no se especifica persist_dir.
+    Si storage es "int8"/"float16" y el índice tiene ese almacenamiento compacto, se usa;
+    también se usa si el índice no contiene Chroma (construido en modo compacto).
+    Con read_only=True (INDEX_READ_ONLY=1) nunca se abre Chroma: ver _load_read_only.
     """
     check_config()
 
@@ -99,8 +298,17 @@ def load_vectorstore(
     if OPENAI_API_KEY is None or OPENAI_API_KEY.strip() == "":
         raise RuntimeError("OPENAI_API_KEY no está configurada. Revisa el archivo .env.")
 
+    if read_only:
+        return _load_read_only(Path(persist_dir), embed_model, storage)
+
+    compact_mode = _pick_compact_mode(persist_dir, storage)
+    if compact_mode is not None:
+        return _open_compact(Path(persist_dir), compact_mode, embed_model)
+
+    # Embeddings con cache de consultas compartida (evita re-embeber preguntas repetidas)
+    embeddings = get_query_embeddings(embed_model)
+
     print(f"[INDEX] Cargando vectorstore Chroma desde {persist_dir} ...")
-    embeddings = OpenAIEmbeddings(api_key=OPENAI_API_KEY, model=embed_model)
     vs = Chroma(persist_directory=str(persist_dir), embedding_function=embeddings)
     print("[INDEX] Vectorstore cargado correctamente.")
     return vs
@@ -118,7 +326,10 @@ def count_docs(persist_dir: Optional[Path] = None) -> Tuple[Path, int]:
         return (INDEX_DIR, 0)
     vs = load_vectorstore(idx)
     try:
-        n = vs._collection.count()  # API interna de Chroma wrapper
+        if isinstance(vs, CompactVectorStore):
+            n = vs.count()
+        else:
+            n = vs._collection.count()  # API interna de Chroma wrapper
     except Exception:
         n = 0
     return (idx, n)
@@ -131,5 +342,37 @@ def run_build_index() -> None:
     build_index()
 
 
+def main(argv: Optional[List[str]] = None) -> None:
+    """
+    python -m app.index                        -> construye un índice nuevo
+    python -m app.index export [--index X] -o snap.tar.gz   (o -o - para stdout)
+    python -m app.index import snap.tar.gz     (o - para stdin) -> nueva versión sin re-embeber
+    """
+    import argparse
+
+    from .snapshot import export_index, import_index
+
+    ap = argparse.ArgumentParser(prog="python -m app.index", description="Construye, exporta o importa índices.")
+    sub = ap.add_subparsers(dest="cmd")
+    sub.add_parser("build", help="construye un índice nuevo desde data/raw (por defecto)")
+    exp = sub.add_parser("export", help="empaqueta una versión del índice en un snapshot .tar.gz")
+    exp.add_argument("--index", default=None, help="carpeta o nombre del índice (por defecto el último)")
+    exp.add_argument("-o", "--out", required=True, help="archivo de salida, o - para stdout")
+    exp.add_argument("--level", type=int, default=6, help="nivel de compresión gzip (1-9)")
+    imp = sub.add_parser("import", help="restaura un snapshot como nueva versión del índice")
+    imp.add_argument("src", help="archivo .tar.gz, o - para stdin")
+    args = ap.parse_args(argv)
+
+    if args.cmd == "export":
+        index_dir = resolve_index(args.index) if args.index else latest_index_dir(INDEX_DIR)
+        if index_dir is None:
+            raise SystemExit("No hay ningún índice disponible para exportar.")
+        export_index(index_dir, args.out, compresslevel=args.level)
+    elif args.cmd == "import":
+        import_index(args.src)
+    else:
+        run_build_index()
+
+
 if __name__ == "__main__":
-    run_build_index()
+    main()
@@ -1,24 +1,69 @@
 from __future__ import annotations
 
+import json
 import os
+from datetime import datetime
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Tuple
 
 from langchain_community.document_loaders import PyPDFLoader, PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
 
 from .config import RAW_DIR, PROCESSED_DIR
+from .dedup import strip_boilerplate, remove_duplicate_chunks, save_dedup_report
+from .parents import build_parent_units
 
 # --- Parametros de split desde .env con defaults seguros ---
 CHUNK_SIZE = int(os.getenv("CHUNK_SIZE", "1200"))
 CHUNK_OVERLAP = int(os.getenv("CHUNK_OVERLAP", "200"))
+# Indice padre-hijo: unidad padre ("" = desactivado, "page" o "article") y tamaño de los hijos
+PARENT_UNIT = os.getenv("PARENT_UNIT", "").strip().lower()
+CHILD_CHUNK_SIZE = int(os.getenv("CHILD_CHUNK_SIZE", "400"))
+CHILD_CHUNK_OVERLAP = int(os.getenv("CHILD_CHUNK_OVERLAP", "50"))
+# Limpieza de cabeceras/pies repetidos y chunks duplicados (1/0)
+INGEST_DEDUP = os.getenv("INGEST_DEDUP", "1").strip() not in ("0", "false", "no", "")
 
 
-def _normalize_doc_meta(doc: Document, pdf_path: Path) -> Document:
-    """Asegura metadatos consistentes: source absoluto y page 0/1-based."""
+def _ingest_date_int(when: datetime | None = None) -> int:
+    """Fecha de ingesta como entero YYYYMMDD (filtrable con $gte/$lte en Chroma)."""
+    when = when or datetime.now()
+    return int(when.strftime("%Y%m%d"))
+
+
+# -------------------------
+# Registro de fechas de ingesta por archivo
+# -------------------------
+# La fecha de ingesta de un PDF es la del dia en que aparecio por primera vez en data/raw
+# (la primera vez se toma su fecha de modificacion), y se conserva entre reconstrucciones.
+INGEST_REGISTRY = PROCESSED_DIR / "ingest_registry.json"
+
+
+def ingest_dates(pdf_files: List[Path], registry_path: Path = INGEST_REGISTRY) -> Dict[str, int]:
+    """Devuelve {nombre_pdf: YYYYMMDD} y registra los PDFs que aun no estaban."""
+    registry: Dict[str, int] = {}
+    if registry_path.exists():
+        try:
+            registry = {k: int(v) for k, v in json.loads(registry_path.read_text(encoding="utf-8")).items()}
+        except Exception:
+            print(f"[INGEST] Aviso: registro de ingesta ilegible ({registry_path}); se regenera.")
+    nuevos = [p for p in pdf_files if p.name not in registry]
+    for p in nuevos:
+        registry[p.name] = _ingest_date_int(datetime.fromtimestamp(p.stat().st_mtime))
+    if nuevos:
+        registry_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = registry_path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(registry, indent=2, sort_keys=True), encoding="utf-8")
+        os.replace(tmp, registry_path)
+    return {p.name: registry[p.name] for p in pdf_files}
+
+
+def _normalize_doc_meta(doc: Document, pdf_path: Path, ingest_date: int | None = None) -> Document:
+    """Asegura metadatos consistentes: source absoluto, nombre de archivo, page 0/1-based y fecha de ingesta."""
     meta = dict(doc.metadata or {})
     meta["source"] = str(pdf_path.resolve())
+    meta["source_name"] = pdf_path.name
+    meta["ingest_date"] = ingest_date or _ingest_date_int()
     page0 = meta.get("page", meta.get("page_number"))
     try:
         page0 = int(page0) if page0 is not None else 0
@@ -29,7 +74,7 @@ def _normalize_doc_meta(doc: Document, pdf_path: Path) -> Document:
     return Document(page_content=doc.page_content, metadata=meta)
 
 
-def _load_single_pdf(pdf_path: Path) -> List[Document]:
+def _load_single_pdf(pdf_path: Path, ingest_date: int | None = None) -> List[Document]:
     """Carga un PDF por paginas, intentando PyMuPDF y cayendo a PyPDF."""
     print(f"[INGEST] Cargando PDF: {pdf_path.name}")
     try:
@@ -38,7 +83,7 @@ def _load_single_pdf(pdf_path: Path) -> List[Document]:
     except Exception:
         loader = PyPDFLoader(str(pdf_path))
         docs = loader.load()
-    return [_normalize_doc_meta(d, pdf_path) for d in docs]
+    return [_normalize_doc_meta(d, pdf_path, ingest_date) for d in docs]
 
 
 def load_pdf_documents(raw_dir: Path = RAW_DIR) -> List[Document]:
@@ -49,10 +94,11 @@ def load_pdf_documents(raw_dir: Path = RAW_DIR) -> List[Document]:
         return []
 
     print(f"[INGEST] Encontrados {len(pdf_files)} PDFs en {raw_dir}")
+    dates = ingest_dates(pdf_files)
     all_docs: List[Document] = []
     for pdf in pdf_files:
         try:
-            docs = _load_single_pdf(pdf)
+            docs = _load_single_pdf(pdf, dates[pdf.name])
             if not docs:
                 print(f"[INGEST] Aviso: {pdf.name} no produjo texto (posible PDF escaneado).")
             all_docs.extend(docs)
@@ -97,6 +143,66 @@ def split_documents(
     return chunks
 
 
+def _clean_pages(documents: List[Document], dedup: bool) -> Tuple[List[Document], Dict[str, Any]]:
+    if not dedup:
+        return documents, {}
+    documents, report = strip_boilerplate(documents)
+    print(f"[INGEST] Lineas de cabecera/pie eliminadas: {report['lineas_cabecera_pie_quitadas']}")
+    return documents, report
+
+
+def _dedup_chunks(chunks: List[Document], report: Dict[str, Any], dedup: bool) -> List[Document]:
+    if not dedup or not chunks:
+        return chunks
+    chunks, chunk_report = remove_duplicate_chunks(chunks)
+    report.update(chunk_report)
+    print(
+        f"[INGEST] Deduplicado: {chunk_report['chunks_entrada']} -> {chunk_report['chunks_salida']} chunks "
+        f"(exactos={chunk_report['duplicados_exactos']}, casi duplicados={chunk_report['casi_duplicados']}, "
+        f"vacios={chunk_report['vacios']})"
+    )
+    path = save_dedup_report(report)
+    print(f"[INGEST] Informe de limpieza: {path}")
+    return chunks
+
+
+def prepare_chunks(
+    documents: List[Document],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    dedup: bool = INGEST_DEDUP,
+) -> Tuple[List[Document], Dict[str, Any]]:
+    """
+    Paginas -> chunks listos para embeber:
+      1) quita cabeceras/pies repetidos por documento,
+      2) trocea,
+      3) elimina chunks duplicados exactos y casi duplicados.
+    Devuelve (chunks, informe). Con dedup=False equivale a split_documents.
+    """
+    documents, report = _clean_pages(documents, dedup)
+    chunks = split_documents(documents, chunk_size, chunk_overlap)
+    return _dedup_chunks(chunks, report, dedup), report
+
+
+def prepare_parent_child(
+    documents: List[Document],
+    parent_unit: str = "page",
+    child_size: int = CHILD_CHUNK_SIZE,
+    child_overlap: int = CHILD_CHUNK_OVERLAP,
+    dedup: bool = INGEST_DEDUP,
+) -> Tuple[List[Document], List[Document], Dict[str, Any]]:
+    """
+    Igual que prepare_chunks pero en dos niveles: las paginas limpias se agrupan en
+    unidades padre (pagina o articulo) y se trocean en hijos pequeños con metadata['parent_id'].
+    Devuelve (padres, hijos, informe).
+    """
+    documents, report = _clean_pages(documents, dedup)
+    parents = build_parent_units(documents, parent_unit)
+    print(f"[INGEST] Unidades padre ({parent_unit}): {len(parents)}")
+    children = split_documents(parents, child_size, child_overlap)
+    return parents, _dedup_chunks(children, report, dedup), report
+
+
 def save_chunks_to_disk(
     chunks: List[Document],
     output_path: Path | None = None,
@@ -127,9 +233,9 @@ def save_chunks_to_disk(
 
 
 def run_ingest() -> None:
-    """1) carga PDFs, 2) trocea, 3) guarda preview."""
+    """1) carga PDFs, 2) limpia y trocea, 3) guarda preview."""
     docs = load_pdf_documents()
-    chunks = split_documents(docs)
+    chunks, _ = prepare_chunks(docs)
     save_chunks_to_disk(chunks)
 
 
@@ -0,0 +1,254 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Deque, Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_openai import ChatOpenAI
+from openai import APIConnectionError, InternalServerError, RateLimitError
+
+from .admission import hold_slot
+from .config import (
+    OPENAI_API_KEY,
+    OPENAI_BASE_URL,
+    DEFAULT_CHAT_MODEL,
+    LLM_TIMEOUT_S,
+    LLM_MAX_RETRIES,
+    LLM_HEDGE,
+    LLM_HEDGE_PERCENTILE,
+    LLM_HEDGE_MIN_DELAY_S,
+    LLM_HEDGE_DEFAULT_DELAY_S,
+    LLM_WORKERS,
+    check_config,
+)
+
+
+class LLMTimeoutError(TimeoutError):
+    """La llamada al LLM no termino dentro de su plazo."""
+
+
+# -------------------------
+# Pool de clientes (uno por (modelo, temperatura))
+# -------------------------
+_CLIENTS: Dict[Tuple[str, float], ChatOpenAI] = {}
+_CLIENTS_LOCK = threading.Lock()
+
+
+def get_chat_client(model: Optional[str] = None, temperature: float = 0.1) -> ChatOpenAI:
+    """
+    Devuelve un ChatOpenAI reutilizable (mantiene su pool HTTP entre consultas).
+    El cliente no reintenta por su cuenta: invoke_llm pasa el plazo restante como timeout
+    de cada peticion y reintenta solo mientras quede plazo.
+    """
+    m = model or DEFAULT_CHAT_MODEL
+    key = (m, round(float(temperature), 3))
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            check_config()
+            if not OPENAI_API_KEY or not OPENAI_API_KEY.strip():
+                raise RuntimeError("OPENAI_API_KEY no esta configurada. Revisa .env.")
+            kwargs: Dict[str, Any] = {}
+            if OPENAI_BASE_URL:
+                kwargs["base_url"] = OPENAI_BASE_URL
+            client = ChatOpenAI(
+                api_key=OPENAI_API_KEY,
+                model=m,
+                temperature=temperature,
+                timeout=LLM_TIMEOUT_S,
+                max_retries=0,
+                stream_usage=True,
+                **kwargs,
+            )
+            _CLIENTS[key] = client
+        return client
+
+
+# -------------------------
+# Estadisticas y latencia hasta el primer token
+# -------------------------
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, int] = {"calls": 0, "hedges": 0, "hedge_wins": 0, "cancellations": 0, "timeouts": 0}
+_TTFT: Deque[float] = deque(maxlen=200)  # segundos hasta el primer token (ventana reciente)
+
+
+def _inc(name: str, n: int = 1) -> None:
+    with _STATS_LOCK:
+        _STATS[name] += n
+
+
+def llm_stats() -> Dict[str, Any]:
+    """Contadores de llamadas, hedges, cancelaciones y timeouts, y el retardo de hedge actual."""
+    with _STATS_LOCK:
+        out: Dict[str, Any] = dict(_STATS)
+        out["ttft_samples"] = len(_TTFT)
+    out["hedge_delay_s"] = round(hedge_delay(), 3)
+    return out
+
+
+def hedge_delay(percentile: float = LLM_HEDGE_PERCENTILE) -> float:
+    """Retardo antes de lanzar la peticion de respaldo: percentil del TTFT reciente."""
+    with _STATS_LOCK:
+        samples = sorted(_TTFT)
+    if len(samples) < 20:
+        return max(LLM_HEDGE_MIN_DELAY_S, LLM_HEDGE_DEFAULT_DELAY_S)
+    idx = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+    return max(LLM_HEDGE_MIN_DELAY_S, samples[idx])
+
+
+# -------------------------
+# Invocacion con plazo y hedging
+# -------------------------
+# Errores transitorios que se reintentan (antes del primer token y dentro del plazo)
+_RETRYABLE = (APIConnectionError, InternalServerError, RateLimitError)
+
+
+class _Attempt:
+    """
+    Una peticion en streaming con plazo absoluto `deadline` (time.monotonic()).
+    Se puede cancelar antes de abrir la conexion y entre chunks; mientras espera el primer
+    token solo la corta su timeout HTTP, que nunca pasa del plazo de la consulta.
+    """
+
+    def __init__(
+        self,
+        client: ChatOpenAI,
+        messages: Sequence[BaseMessage],
+        first_token: threading.Event,
+        deadline: float,
+    ):
+        self.client = client
+        self.messages = list(messages)
+        self.first_token = first_token
+        self.deadline = deadline
+        self.cancel = threading.Event()
+        self.started = time.perf_counter()
+        self.got_token = False
+
+    def run(self) -> Optional[AIMessageChunk]:
+        for retry in range(max(0, LLM_MAX_RETRIES) + 1):
+            if self.cancel.is_set():
+                return None
+            timeout = self.deadline - time.monotonic()
+            if timeout <= 0:
+                raise LLMTimeoutError("Plazo agotado antes de enviar la peticion al LLM.")
+            try:
+                return self._stream(timeout)
+            except _RETRYABLE:
+                if self.got_token or retry >= LLM_MAX_RETRIES:
+                    raise
+        return None
+
+    def _stream(self, timeout: float) -> Optional[AIMessageChunk]:
+        result: Optional[AIMessageChunk] = None
+        stream = self.client.stream(self.messages, timeout=timeout)
+        try:
+            for chunk in stream:
+                if self.cancel.is_set():
+                    return None
+                if not self.got_token and chunk.content:
+                    self.got_token = True
+                    with _STATS_LOCK:
+                        _TTFT.append(time.perf_counter() - self.started)
+                    self.first_token.set()
+                result = chunk if result is None else result + chunk
+        finally:
+            stream.close()  # cierra la respuesta HTTP si se cancela a mitad
+        return result
+
+
+_EXECUTOR = ThreadPoolExecutor(max_workers=max(1, LLM_WORKERS), thread_name_prefix="llm")
+
+
+def invoke_llm(
+    messages: Sequence[BaseMessage],
+    *,
+    model: Optional[str] = None,
+    temperature: float = 0.1,
+    deadline_s: Optional[float] = None,
+    hedge: bool = LLM_HEDGE,
+) -> AIMessageChunk:
+    """
+    Llama al LLM en streaming con plazo total `deadline_s` (por defecto LLM_TIMEOUT_S).
+    Con hedge=True, si no llega ningun token antes de hedge_delay() se lanza una segunda
+    peticion identica; gana la primera que emite un token y la otra se cancela.
+    Ninguna peticion dura mas que el plazo (timeout HTTP = plazo restante), y las que siguen
+    en marcha al volver mantienen ocupado el hueco de admision de la consulta (app.admission).
+    Lanza LLMTimeoutError si se agota el plazo.
+    """
+    client = get_chat_client(model, temperature)
+    deadline = time.monotonic() + (deadline_s if deadline_s is not None else LLM_TIMEOUT_S)
+    _inc("calls")
+
+    first_token = threading.Event()
+    attempts: List[_Attempt] = []
+    futures: Dict[Future, _Attempt] = {}
+
+    def _launch() -> Future:
+        att = _Attempt(client, messages, first_token, deadline)
+        fut = _EXECUTOR.submit(att.run)
+        hold_slot(fut)
+        attempts.append(att)
+        futures[fut] = att
+        return fut
+
+    def _remaining() -> float:
+        return max(0.0, deadline - time.monotonic())
+
+    def _cancel(others: Sequence[_Attempt]) -> None:
+        for fut, a in futures.items():
+            if a in others and not a.cancel.is_set():
+                a.cancel.set()
+                fut.cancel()  # si aun no ha arrancado, no llega a enviar la peticion
+                _inc("cancellations")
+
+    _launch()
+
+    if hedge:
+        primary = next(iter(futures))
+        t_hedge = time.monotonic() + min(hedge_delay(), _remaining())
+        while time.monotonic() < t_hedge and not first_token.is_set() and not primary.done():
+            first_token.wait(0.02)
+        if not first_token.is_set() and not primary.done() and _remaining() > 0:
+            _launch()
+            _inc("hedges")
+
+    # Cuando alguna emite token, nos quedamos con ella y cancelamos el resto
+    winner: Optional[_Attempt] = None
+    pending = set(futures)
+    errors: List[BaseException] = []
+    while pending:
+        if winner is None:
+            for a in attempts:
+                if a.got_token:
+                    winner = a
+                    _cancel([o for o in attempts if o is not a])
+                    if a is not attempts[0]:
+                        _inc("hedge_wins")
+                    break
+        done, pending = wait(pending, timeout=min(0.05, _remaining()), return_when=FIRST_COMPLETED)
+        for fut in done:
+            att = futures[fut]
+            if att.cancel.is_set() or fut.cancelled():
+                continue
+            exc = fut.exception()
+            if exc is not None:
+                errors.append(exc)
+                continue
+            result = fut.result()
+            if result is not None:
+                _cancel([o for o in attempts if o is not att])
+                if att is not attempts[0] and winner is None:
+                    _inc("hedge_wins")
+                return result
+        if _remaining() <= 0:
+            _cancel(attempts)
+            _inc("timeouts")
+            raise LLMTimeoutError(f"El LLM no respondio en el plazo de {deadline_s or LLM_TIMEOUT_S:.1f} s.")
+
+    if errors:
+        raise errors[0]
+    return AIMessageChunk(content="")
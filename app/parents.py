@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from langchain_core.documents import Document
+
+from .config import PARENT_MAX_CHARS
+
+# -------------------------
+# Indice padre-hijo
+# -------------------------
+# Los chunks hijos (pequeños) se embeben para buscar con precision; cada uno lleva
+# metadata['parent_id'] apuntando a su unidad padre (pagina o articulo), guardada en
+# un almacen clave-valor local (parents.sqlite3 dentro de la carpeta del indice).
+PARENT_UNITS = ("page", "article")
+PARENT_STORE_FILE = "parents.sqlite3"
+
+# Encabezados "Artículo 12.", "ARTÍCULO 12 -", "Artículo 3 bis —" al principio de linea. Distingue
+# mayusculas y exige el separador tras el numero: una referencia cortada por el salto de linea del
+# PDF ("...previsto en el\nartículo 38 del Estatuto", "Artículo 38.2") no abre un padre nuevo.
+_ARTICLE_RE = re.compile(
+    r"^[ \t]*(?:Art[íi]culo|ART[ÍI]CULO)\s+\d+(?:\s+(?:bis|ter|quater|BIS|TER|QUATER))?\s*(?:\.(?!\d)|-|—|–)",
+    re.MULTILINE,
+)
+
+
+def _parent_id(source: str, page: int, n: int) -> str:
+    return hashlib.sha1(f"{source}|{page}|{n}".encode("utf-8")).hexdigest()[:16]
+
+
+def _split_long(text: str, max_chars: int) -> List[str]:
+    """Parte un texto en trozos de como mucho max_chars, por saltos de linea si es posible."""
+    if max_chars <= 0 or len(text) <= max_chars:
+        return [text]
+    pieces: List[str] = []
+    current = ""
+    for line in text.splitlines(keepends=True):
+        while len(line) > max_chars:  # linea sin saltos mas larga que el maximo
+            if current:
+                pieces.append(current)
+                current = ""
+            pieces.append(line[:max_chars])
+            line = line[max_chars:]
+        if len(current) + len(line) > max_chars and current:
+            pieces.append(current)
+            current = ""
+        current += line
+    if current.strip():
+        pieces.append(current)
+    return [p for p in pieces if p.strip()]
+
+
+def build_parent_units(
+    pages: List[Document],
+    unit: str = "page",
+    max_chars: int = PARENT_MAX_CHARS,
+) -> List[Document]:
+    """
+    Agrupa las paginas en unidades padre:
+      - page: cada pagina es un padre
+      - article: por documento, se corta el texto en cada "Artículo N" (el preámbulo
+        antes del primer articulo es su propio padre); metadata page = pagina de inicio
+    Un padre de mas de max_chars caracteres (p.ej. un PDF sin "Artículo N") se parte en
+    varios padres consecutivos, para que uno solo no llene el contexto.
+    """
+    if unit not in PARENT_UNITS:
+        raise ValueError(f"Unidad padre no soportada: {unit!r} (usa {PARENT_UNITS}).")
+
+    parents: List[Document] = []
+    if unit == "page":
+        n = 0
+        for doc in pages:
+            for piece in _split_long(doc.page_content, max_chars):
+                meta = dict(doc.metadata or {})
+                meta["parent_id"] = _parent_id(str(meta.get("source", "")), int(meta.get("page", 0)), n)
+                parents.append(Document(page_content=piece, metadata=meta))
+                n += 1
+        return parents
+
+    # article: recorrer paginas de cada documento en orden, acumulando hasta el siguiente articulo
+    by_source: Dict[str, List[Document]] = {}
+    for doc in pages:
+        by_source.setdefault(str((doc.metadata or {}).get("source", "")), []).append(doc)
+
+    for source, docs in by_source.items():
+        docs = sorted(docs, key=lambda d: int((d.metadata or {}).get("page", 0)))
+        current: List[str] = []
+        current_meta: Optional[dict] = None
+        n = 0
+
+        def _flush() -> None:
+            nonlocal n, current, current_meta
+            text = "\n".join(current).strip()
+            if text and current_meta is not None:
+                for piece in _split_long(text, max_chars):
+                    meta = dict(current_meta)
+                    meta["parent_id"] = _parent_id(source, int(meta.get("page", 0)), n)
+                    parents.append(Document(page_content=piece.strip(), metadata=meta))
+                    n += 1
+            current, current_meta = [], None
+
+        for doc in docs:
+            text = doc.page_content
+            cuts = {m.start() for m in _ARTICLE_RE.finditer(text)}
+            bounds = sorted(cuts | {0, len(text)})
+            for a, b in zip(bounds, bounds[1:]):
+                if a in cuts:
+                    _flush()  # empieza un articulo nuevo
+                if current_meta is None:
+                    current_meta = dict(doc.metadata or {})
+                current_meta["page_end"] = (doc.metadata or {}).get("page_display")
+                if text[a:b].strip():
+                    current.append(text[a:b])
+        _flush()
+    return parents
+
+
+# -------------------------
+# Almacen clave-valor de padres (SQLite)
+# -------------------------
+class ParentStore:
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(str(self.path), timeout=5.0)
+
+    def _connect_ro(self) -> sqlite3.Connection:
+        # Lecturas sin bloqueo de escritura: varios procesos pueden compartir el indice
+        return sqlite3.connect(f"{self.path.resolve().as_uri()}?mode=ro", uri=True, timeout=5.0)
+
+    def write(self, parents: Sequence[Document]) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as con, con:
+            con.execute(
+                "CREATE TABLE IF NOT EXISTS parents (id TEXT PRIMARY KEY, text TEXT NOT NULL, metadata TEXT NOT NULL)"
+            )
+            con.executemany(
+                "INSERT OR REPLACE INTO parents (id, text, metadata) VALUES (?, ?, ?)",
+                [
+                    (d.metadata["parent_id"], d.page_content, json.dumps(d.metadata, ensure_ascii=False))
+                    for d in parents
+                ],
+            )
+
+    def get_many(self, ids: Sequence[str]) -> Dict[str, Document]:
+        if not ids:
+            return {}
+        marks = ",".join("?" for _ in ids)
+        with closing(self._connect_ro()) as con:
+            rows = con.execute(f"SELECT id, text, metadata FROM parents WHERE id IN ({marks})", list(ids)).fetchall()
+        return {pid: Document(page_content=text, metadata=json.loads(meta)) for pid, text, meta in rows}
+
+    def count(self) -> int:
+        with closing(self._connect_ro()) as con:
+            return int(con.execute("SELECT COUNT(*) FROM parents").fetchone()[0])
+
+
+def open_parent_store(index_dir: Optional[Path]) -> Optional[ParentStore]:
+    """ParentStore del indice, o None si el indice no es padre-hijo."""
+    if index_dir is None:
+        return None
+    path = Path(index_dir) / PARENT_STORE_FILE
+    return ParentStore(path) if path.exists() else None
+
+
+def _trim_around(parent: Document, child_text: str, budget_chars: int) -> Document:
+    """Ventana de budget_chars del padre centrada en el texto del hijo (o su inicio)."""
+    text = parent.page_content
+    pos = text.find(child_text[:200]) if child_text else -1
+    center = pos + len(child_text) // 2 if pos >= 0 else budget_chars // 2
+    start = max(0, min(center - budget_chars // 2, len(text) - budget_chars))
+    meta = dict(parent.metadata or {})
+    meta["truncated"] = True
+    return Document(page_content=text[start : start + budget_chars], metadata=meta)
+
+
+def collapse_multi(
+    children: List[Document],
+    stores: Dict[str, ParentStore],
+    k: int,
+    budget_chars: int,
+) -> List[Document]:
+    """
+    Agrupa los hijos recuperados por (indice, parent_id) en orden de mejor rango; el indice
+    de cada hijo viene en metadata['index']. Devuelve como mucho k padres sin duplicar y sin
+    pasar de budget_chars (el primero siempre entra, recortado a budget_chars si no cabe
+    entero). Los resultados de indices sin almacen de padres pasan tal cual.
+    """
+    units: List[Tuple[str, Optional[str], Document]] = []  # (indice, parent_id | None, doc)
+    hits: Dict[Tuple[str, str], int] = {}
+    for child in children:
+        meta = child.metadata or {}
+        idx = str(meta.get("index", ""))
+        pid = meta.get("parent_id") if idx in stores else None
+        if not pid:
+            units.append((idx, None, child))
+            continue
+        if (idx, pid) in hits:
+            hits[(idx, pid)] += 1
+            continue
+        hits[(idx, pid)] = 1
+        units.append((idx, pid, child))
+
+    wanted: Dict[str, List[str]] = {}
+    for idx, pid in hits:
+        wanted.setdefault(idx, []).append(pid)
+    found: Dict[Tuple[str, str], Document] = {}
+    for idx, pids in wanted.items():
+        for pid, doc in stores[idx].get_many(pids).items():
+            found[(idx, pid)] = doc
+
+    out: List[Document] = []
+    used = 0
+    for idx, pid, child in units:
+        if pid is None:
+            doc = child
+        else:
+            doc = found.get((idx, pid))
+            if doc is None:
+                continue
+            doc.metadata["child_hits"] = hits[(idx, pid)]
+            for key in ("index", "score"):
+                if key in (child.metadata or {}):
+                    doc.metadata[key] = child.metadata[key]
+        size = len(doc.page_content)
+        if out and used + size > budget_chars:
+            continue
+        if not out and size > budget_chars:
+            # Padre mayor que todo el presupuesto (indices antiguos): se recorta alrededor del hijo
+            doc = _trim_around(doc, child.page_content, budget_chars)
+            size = len(doc.page_content)
+        out.append(doc)
+        used += size
+        if len(out) >= k:
+            break
+    return out
@@ -1,37 +1,160 @@
 from __future__ import annotations
 
-from typing import Dict, Any, List, Optional
+from datetime import date
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple, Union
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.documents import Document
 from openai import RateLimitError, AuthenticationError, APIError
 
-from .config import OPENAI_API_KEY, DEFAULT_CHAT_MODEL, check_config
-from .index import load_vectorstore
+from .admission import Deadline, OverloadedError, admission_slot
+from .config import RETRIEVAL_INDICES, RAG_DEADLINE_S, RAG_MIN_LLM_S, RAG_MIN_SCORE
+from .fanout import RetrievalTimeoutError, fanout_search
+from .index import latest_index_dir
+from .llm import LLMTimeoutError, get_chat_client, invoke_llm
 
 
 # -------------------------
 # LLM
 # -------------------------
 def get_llm(temperature: float = 0.1, model: Optional[str] = None) -> ChatOpenAI:
-    check_config()
-    m = model or DEFAULT_CHAT_MODEL
-    if not OPENAI_API_KEY or not OPENAI_API_KEY.strip():
-        raise RuntimeError("OPENAI_API_KEY no esta configurada. Revisa .env.")
-    return ChatOpenAI(api_key=OPENAI_API_KEY, model=m, temperature=temperature)
+    """Cliente de chat compartido por (modelo, temperatura); ver app.llm."""
+    return get_chat_client(model, temperature)
+
+
+def _usage_of(response: Any) -> Dict[str, Any]:
+    """Uso de tokens con claves de OpenAI (prompt_tokens...), venga de invoke o de streaming."""
+    usage = (getattr(response, "response_metadata", None) or {}).get("token_usage")
+    if usage:
+        return usage
+    um = getattr(response, "usage_metadata", None) or {}
+    if not um:
+        return {}
+    return {
+        "prompt_tokens": um.get("input_tokens", 0),
+        "completion_tokens": um.get("output_tokens", 0),
+        "total_tokens": um.get("total_tokens", 0),
+    }
+
+
+# -------------------------
+# Filtros de metadatos (se empujan al `where` de Chroma)
+# -------------------------
+DateLike = Union[date, str, int]
+
+
+def _date_to_int(value: DateLike) -> int:
+    """Normaliza una fecha (date, 'YYYY-MM-DD' o YYYYMMDD) al entero YYYYMMDD guardado en metadatos."""
+    if isinstance(value, date):
+        return int(value.strftime("%Y%m%d"))
+    if isinstance(value, int):
+        return value
+    s = str(value).strip().replace("-", "").replace("/", "")
+    if len(s) != 8 or not s.isdigit():
+        raise ValueError(f"Fecha de ingesta no valida: {value!r} (usa YYYY-MM-DD).")
+    return int(s)
+
+
+def build_where(
+    sources: Optional[Sequence[str]] = None,
+    page_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+    ingested_from: Optional[DateLike] = None,
+    ingested_to: Optional[DateLike] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Construye la clausula `where` de Chroma a partir de los filtros:
+      - sources: nombres de archivo (p.ej. 'BOCM-...pdf'); se compara con metadata['source_name']
+      - page_range: (desde, hasta) en paginas 1-based (page_display), extremos inclusivos
+      - ingested_from / ingested_to: rango de fecha de ingesta (metadata['ingest_date'])
+    Devuelve None si no hay ningun filtro activo.
+    """
+    clauses: List[Dict[str, Any]] = []
+
+    if sources:
+        names = sorted({s.replace("\\", "/").split("/")[-1] for s in sources if s})
+        if len(names) == 1:
+            clauses.append({"source_name": names[0]})
+        elif names:
+            clauses.append({"source_name": {"$in": names}})
+
+    if page_range is not None:
+        p_from, p_to = page_range
+        if p_from is not None:
+            clauses.append({"page_display": {"$gte": int(p_from)}})
+        if p_to is not None:
+            clauses.append({"page_display": {"$lte": int(p_to)}})
+
+    if ingested_from is not None:
+        clauses.append({"ingest_date": {"$gte": _date_to_int(ingested_from)}})
+    if ingested_to is not None:
+        clauses.append({"ingest_date": {"$lte": _date_to_int(ingested_to)}})
+
+    if not clauses:
+        return None
+    # Chroma exige al menos dos elementos dentro de $and
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
 
 
 # -------------------------
 # Retrieval (similarity o MMR)
 # -------------------------
-def retrieve_documents(question: str, k: int = 4, use_mmr: bool = False) -> List[Document]:
-    vs = load_vectorstore()
-    if use_mmr:
-        return vs.max_marginal_relevance_search(
-            question, k=k, fetch_k=max(8, k * 2), lambda_mult=0.5
-        )
-    return vs.similarity_search(question, k=k)
+def retrieve_documents(
+    question: str,
+    k: int = 4,
+    use_mmr: bool = False,
+    *,
+    fetch_k: Optional[int] = None,
+    lambda_mult: float = 0.5,
+    persist_dir: Optional[Path] = None,
+    indices: Optional[Sequence[Union[str, Path]]] = None,
+    sources: Optional[Sequence[str]] = None,
+    page_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+    ingested_from: Optional[DateLike] = None,
+    ingested_to: Optional[DateLike] = None,
+    deadline_s: Optional[float] = None,
+    report: Optional[Dict[str, Any]] = None,
+) -> List[Document]:
+    """
+    Recupera los k documentos mas relevantes (similitud o MMR) con filtros de metadatos.
+    Cada documento lleva metadata['score'] = similitud coseno con la pregunta (en MMR
+    tambien; en un padre, la de su mejor hijo).
+    En un indice padre-hijo se buscan k * PARENT_CHILD_FANOUT hijos y se devuelven sus
+    padres sin duplicar, como mucho k y dentro de PARENT_CONTEXT_CHARS caracteres.
+    Con `indices` (o RETRIEVAL_INDICES) se consultan varios indices en paralelo y se
+    fusionan por similitud coseno (ver app.fanout); persist_dir tiene prioridad.
+    deadline_s solo acota la espera a los shards (una busqueda en curso no se interrumpe);
+    `report` recibe los shards que no respondieron a tiempo o fallaron (ver fanout_search).
+    """
+    where = build_where(sources, page_range, ingested_from, ingested_to)
+    if persist_dir is None:
+        indices = indices or RETRIEVAL_INDICES
+    else:
+        indices = [persist_dir]
+    if not indices:
+        latest = latest_index_dir()
+        if latest is None:
+            raise RuntimeError("No hay ningún índice disponible. Reconstrúyelo.")
+        indices = [latest]
+    # Un solo indice es el caso n=1 del abanico: mismas puntuaciones coseno y colapso a padres
+    return fanout_search(
+        question,
+        indices,
+        k=k,
+        use_mmr=use_mmr,
+        fetch_k=fetch_k,
+        lambda_mult=lambda_mult,
+        where=where,
+        deadline_s=deadline_s,
+        report=report,
+    )
+
+
+def top_score(docs: Sequence[Document]) -> Optional[float]:
+    """Mejor similitud coseno entre los documentos recuperados (None si no hay)."""
+    scores = [d.metadata["score"] for d in docs if (d.metadata or {}).get("score") is not None]
+    return max(scores) if scores else None
 
 
 # -------------------------
@@ -57,6 +180,19 @@ def build_prompt() -> ChatPromptTemplate:
 # -------------------------
 # Pipeline RAG
 # -------------------------
+# Todas las respuestas llevan "status":
+#   ok       -> respuesta del LLM con sus fuentes
+#   partial  -> se agoto el plazo: solo fuentes (sin respuesta del LLM)
+#   no_answer-> la recuperacion no supera RAG_MIN_SCORE: respuesta "sin datos" sin llamar al LLM
+#   rejected -> sistema saturado: la consulta no se proceso (ver app.admission)
+#   error    -> error de API o inesperado
+MSG_PARTIAL = (
+    "No ha dado tiempo a generar la respuesta. Estas son las fuentes mas relevantes encontradas."
+)
+MSG_NO_INFO = "No dispongo de datos suficientes en la documentacion para responder a esa pregunta."
+MSG_REJECTED = "El sistema esta atendiendo demasiadas consultas. Intentalo de nuevo en unos segundos."
+
+
 def ask_question(
     question: str,
     *,
@@ -64,17 +200,87 @@ def ask_question(
     temperature: float = 0.1,
     model: Optional[str] = None,
     use_mmr: bool = False,
+    fetch_k: Optional[int] = None,
+    lambda_mult: float = 0.5,
+    persist_dir: Optional[Path] = None,
+    indices: Optional[Sequence[Union[str, Path]]] = None,
+    sources: Optional[Sequence[str]] = None,
+    page_range: Optional[Tuple[Optional[int], Optional[int]]] = None,
+    ingested_from: Optional[DateLike] = None,
+    ingested_to: Optional[DateLike] = None,
+    deadline_s: Optional[float] = RAG_DEADLINE_S,
+    min_score: Optional[float] = RAG_MIN_SCORE,
 ) -> Dict[str, Any]:
+    """
+    Recupera contexto y genera la respuesta dentro de un presupuesto total de deadline_s
+    segundos (espera en cola + recuperacion + LLM). Si el presupuesto se agota antes de
+    terminar la generacion devuelve solo las fuentes (status "partial").
+    Con min_score, si la mejor similitud recuperada no lo alcanza se devuelve la respuesta
+    estandar "sin datos" con las fuentes, sin llamar al LLM (status "no_answer").
+    El resultado incluye "score": la mejor similitud coseno recuperada.
+    """
+    deadline = Deadline(deadline_s)
     try:
-        docs = retrieve_documents(question, k=k, use_mmr=use_mmr)
-        context_text = "\n\n".join(d.page_content for d in docs)
+        with admission_slot(deadline):
+            return _answer(
+                question,
+                deadline,
+                k=k,
+                temperature=temperature,
+                model=model,
+                min_score=min_score,
+                use_mmr=use_mmr,
+                fetch_k=fetch_k,
+                lambda_mult=lambda_mult,
+                persist_dir=persist_dir,
+                indices=indices,
+                sources=sources,
+                page_range=page_range,
+                ingested_from=ingested_from,
+                ingested_to=ingested_to,
+            )
+    except OverloadedError:
+        return {"answer": MSG_REJECTED, "context": [], "status": "rejected"}
+
+
+def _answer(
+    question: str,
+    deadline: Deadline,
+    *,
+    k: int,
+    temperature: float,
+    model: Optional[str],
+    min_score: Optional[float],
+    **retrieval: Any,
+) -> Dict[str, Any]:
+    docs: List[Document] = []
+    score: Optional[float] = None
+    try:
+        report: Dict[str, Any] = {}
+        docs = retrieve_documents(question, k=k, deadline_s=deadline.remaining(), report=report, **retrieval)
+        score = top_score(docs)
+        # Recuperacion cortada por el plazo: no es un "sin datos", y el umbral no se aplica
+        if report.get("timed_out"):
+            return {"answer": MSG_PARTIAL, "context": docs, "status": "partial", "score": score}
+        if min_score is not None and (score is None or score < min_score):
+            # Con algun shard caido la puntuacion no es fiable para afirmar que no hay datos
+            if report.get("failed"):
+                return {"answer": MSG_PARTIAL, "context": docs, "status": "partial", "score": score}
+            return {"answer": MSG_NO_INFO, "context": docs, "usage": {}, "status": "no_answer", "score": score}
+        remaining = deadline.remaining()
+        if remaining is not None and remaining < RAG_MIN_LLM_S:
+            return {"answer": MSG_PARTIAL, "context": docs, "status": "partial", "score": score}
 
-        chain = build_prompt() | get_llm(temperature=temperature, model=model)
-        response = chain.invoke({"context": context_text, "input": question})
+        context_text = "\n\n".join(d.page_content for d in docs)
+        messages = build_prompt().format_messages(context=context_text, input=question)
+        response = invoke_llm(messages, model=model, temperature=temperature, deadline_s=remaining)
         answer_text = response.content if hasattr(response, "content") else str(response)
+        usage = _usage_of(response)
 
-        return {"answer": answer_text, "context": docs}
+        return {"answer": answer_text, "context": docs, "usage": usage, "status": "ok", "score": score}
 
+    except (LLMTimeoutError, RetrievalTimeoutError):
+        return {"answer": MSG_PARTIAL, "context": docs, "status": "partial", "score": score}
     except RateLimitError:
         return {
             "answer": (
@@ -82,19 +288,22 @@ def ask_question(
                 "Revisa el billing del proyecto en OpenAI."
             ),
             "context": [],
+            "status": "error",
         }
     except AuthenticationError:
         return {
             "answer": "Error de autenticacion con la API. Revisa OPENAI_API_KEY en .env.",
             "context": [],
+            "status": "error",
         }
     except APIError as e:
         return {
             "answer": f"Error de API de OpenAI: {e}",
             "context": [],
+            "status": "error",
         }
     except Exception as e:
-        return {"answer": f"Error inesperado en RAG: {e}", "context": []}
+        return {"answer": f"Error inesperado en RAG: {e}", "context": [], "status": "error"}
 
 
 # -------------------------
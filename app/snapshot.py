@@ -0,0 +1,216 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import io
+import json
+import shutil
+import sys
+import tarfile
+import time
+import zlib
+from pathlib import Path, PurePosixPath
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+from .config import INDEX_DIR
+from .index import _new_index_dir, _write_manifest, read_manifest
+
+# -------------------------
+# Snapshots portables de un indice
+# -------------------------
+# Un snapshot es un tar.gz escrito y leido en streaming (se puede canalizar por ssh con "-"):
+#   <ficheros del indice>       : Chroma (sqlite + segmentos HNSW) o compact_*, chunks/, parents.sqlite3...
+#   SNAPSHOT.json (al final)    : version de formato, indice de origen y sha256 + tamaño de cada fichero
+# Al exportar a un fichero se escribe ademas <archivo>.sha256 con el hash del archivo completo.
+SNAPSHOT_FORMAT = 1
+SNAPSHOT_MEMBER = "SNAPSHOT.json"
+_BUF = 1024 * 1024
+
+
+class SnapshotError(RuntimeError):
+    """Snapshot corrupto, incompleto o no reconocido."""
+
+
+class _HashingReader(io.RawIOBase):
+    """Envuelve un fichero y calcula sha256 de lo que se va leyendo."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self.raw = raw
+        self.sha = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:  # type: ignore[override]
+        data = self.raw.read(len(b))
+        n = len(data)
+        b[:n] = data
+        self.sha.update(data)
+        return n
+
+
+class _HashingWriter(io.RawIOBase):
+    """Cuenta y hashea lo que se escribe en el destino (hash del archivo completo)."""
+
+    def __init__(self, raw: BinaryIO) -> None:
+        self.raw = raw
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:  # type: ignore[override]
+        self.raw.write(b)
+        self.sha.update(b)
+        self.size += len(b)
+        return len(b)
+
+
+def export_index(
+    index_dir: Path,
+    out: Union[str, Path],
+    compresslevel: int = 6,
+) -> Dict[str, Any]:
+    """
+    Empaqueta index_dir en un snapshot (tar.gz en streaming). out="-" escribe en stdout.
+    Devuelve la descripcion del snapshot (ficheros, tamaños, sha256).
+    """
+    index_dir = Path(index_dir)
+    if not index_dir.is_dir() or not any(index_dir.iterdir()):
+        raise SnapshotError(f"{index_dir} no existe o esta vacio.")
+    to_stdout = str(out) == "-"
+    log = sys.stderr if to_stdout else sys.stdout
+
+    files: Dict[str, Dict[str, Any]] = {}
+    sink: BinaryIO = sys.stdout.buffer if to_stdout else Path(out).open("wb")
+    writer = _HashingWriter(sink)
+    try:
+        # gzip explicito: tarfile en modo stream no acepta compresslevel (Python < 3.12)
+        with gzip.GzipFile(fileobj=writer, mode="wb", compresslevel=compresslevel) as gz, \
+                tarfile.open(fileobj=gz, mode="w|") as tar:
+            for path in sorted(p for p in index_dir.rglob("*") if p.is_file()):
+                rel = path.relative_to(index_dir).as_posix()
+                info = tar.gettarinfo(str(path), arcname=rel)
+                with path.open("rb") as f:
+                    reader = _HashingReader(f)
+                    tar.addfile(info, io.BufferedReader(reader, buffer_size=_BUF))
+                files[rel] = {"size": info.size, "sha256": reader.sha.hexdigest()}
+
+            snapshot = {
+                "format": SNAPSHOT_FORMAT,
+                "source_index": index_dir.name,
+                "manifest": read_manifest(index_dir),
+                "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+                "files": files,
+            }
+            data = json.dumps(snapshot, indent=2, ensure_ascii=False).encode("utf-8")
+            info = tarfile.TarInfo(SNAPSHOT_MEMBER)
+            info.size = len(data)
+            info.mtime = int(time.time())
+            tar.addfile(info, io.BytesIO(data))
+    finally:
+        if to_stdout:
+            sink.flush()
+        else:
+            sink.close()
+
+    total = sum(f["size"] for f in files.values())
+    if not to_stdout:
+        digest = writer.sha.hexdigest()
+        Path(f"{out}.sha256").write_text(f"{digest}  {Path(out).name}\n", encoding="utf-8")
+        snapshot["archive_sha256"] = digest
+    print(
+        f"[SNAPSHOT] Exportado {index_dir.name}: {len(files)} ficheros, {total / 1e6:.1f} MB "
+        f"-> {writer.size / 1e6:.1f} MB comprimido",
+        file=log,
+    )
+    return snapshot
+
+
+def _safe_member(name: str) -> PurePosixPath:
+    rel = PurePosixPath(name)
+    if rel.is_absolute() or ".." in rel.parts or not rel.parts:
+        raise SnapshotError(f"Ruta no permitida en el snapshot: {name!r}")
+    return rel
+
+
+def _check_archive_sha(path: Path) -> None:
+    side = Path(f"{path}.sha256")
+    if not side.exists():
+        return
+    expected = side.read_text(encoding="utf-8").split()[0]
+    sha = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(_BUF), b""):
+            sha.update(block)
+    if sha.hexdigest() != expected:
+        raise SnapshotError(f"El sha256 de {path.name} no coincide con {side.name}.")
+
+
+def import_index(src: Union[str, Path], base: Path = INDEX_DIR) -> Path:
+    """
+    Restaura un snapshot (src="-" lee de stdin) como una NUEVA version index_* en base,
+    sin re-embeber. Se extrae en streaming a una carpeta temporal, se verifican tamaño y
+    sha256 de cada fichero contra SNAPSHOT.json y solo entonces se publica la carpeta.
+    """
+    from_stdin = str(src) == "-"
+    if not from_stdin:
+        _check_archive_sha(Path(src))
+    base.mkdir(parents=True, exist_ok=True)
+    staging = base / f".import_{int(time.time() * 1000)}"
+    staging.mkdir(parents=True)
+
+    hashes: Dict[str, Dict[str, Any]] = {}
+    snapshot: Optional[Dict[str, Any]] = None
+    source: BinaryIO = sys.stdin.buffer if from_stdin else Path(src).open("rb")
+    try:
+        with gzip.GzipFile(fileobj=source, mode="rb") as gz, tarfile.open(fileobj=gz, mode="r|") as tar:
+            for member in tar:
+                if member.name == SNAPSHOT_MEMBER:
+                    snapshot = json.loads(tar.extractfile(member).read().decode("utf-8"))
+                    continue
+                if member.isdir():
+                    continue
+                if not member.isfile():
+                    raise SnapshotError(f"Tipo de entrada no permitido en el snapshot: {member.name!r}")
+                target = staging.joinpath(*_safe_member(member.name).parts)
+                target.parent.mkdir(parents=True, exist_ok=True)
+                sha = hashlib.sha256()
+                size = 0
+                fin = tar.extractfile(member)
+                with target.open("wb") as fout:
+                    for block in iter(lambda: fin.read(_BUF), b""):
+                        fout.write(block)
+                        sha.update(block)
+                        size += len(block)
+                hashes[member.name] = {"size": size, "sha256": sha.hexdigest()}
+
+        if snapshot is None:
+            raise SnapshotError("Falta SNAPSHOT.json: el archivo esta incompleto o no es un snapshot.")
+        if snapshot.get("format") != SNAPSHOT_FORMAT:
+            raise SnapshotError(f"Formato de snapshot no soportado: {snapshot.get('format')!r}")
+        expected = snapshot.get("files") or {}
+        bad = sorted(k for k in set(hashes) | set(expected) if hashes.get(k) != expected.get(k))
+        if bad:
+            raise SnapshotError(f"Checksums no coinciden ({len(bad)} ficheros): {bad[:5]}")
+
+        target_dir = _new_index_dir(base)
+        staging.rename(target_dir)
+    except (EOFError, OSError, tarfile.TarError, zlib.error) as e:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise SnapshotError(f"Snapshot ilegible o truncado: {e}") from e
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        if not from_stdin:
+            source.close()
+
+    manifest = dict(snapshot.get("manifest") or {})
+    manifest["imported_from"] = snapshot.get("source_index")
+    manifest["imported"] = time.strftime("%Y-%m-%d %H:%M:%S")
+    _write_manifest(target_dir, manifest)
+    print(f"[SNAPSHOT] Importado {snapshot.get('source_index')} como {target_dir.name} ({len(hashes)} ficheros)",
+          file=sys.stderr if from_stdin else sys.stdout)
+    return target_dir
@@ -0,0 +1,133 @@
+import csv, time
+from pathlib import Path
+from datetime import datetime
+import sys, os
+
+import numpy as np
+
+# Añadir el parent al sys.path para importar app.*
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.config import check_config
+from app.index import latest_index_dir, load_vectorstore
+from app.compact import CompactVectorStore, compact_dir, compact_from_chroma, has_compact_store
+
+# Parámetros del benchmark (ajústalos si quieres)
+K = 4
+MODES = ["int8", "float16"]
+
+EVAL_DIR = Path("eval")
+EVAL_DIR.mkdir(exist_ok=True)
+
+OUT_CSV = EVAL_DIR / f"bench_compact_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+IN_CSV = EVAL_DIR / "preguntas.csv"
+
+
+def _dir_size(path: Path) -> int:
+    return sum(p.stat().st_size for p in path.rglob("*") if p.is_file())
+
+
+def _recall(found, truth) -> float:
+    if not truth:
+        return 0.0
+    return len(set(found) & set(truth)) / len(truth)
+
+
+def main():
+    """
+    Compara la búsqueda actual (Chroma similarity_search) con el almacenamiento compacto
+    (int8 + re-rank float32, float16) sobre eval/preguntas.csv:
+      - recall@K frente a Chroma y frente a la búsqueda exacta float32 (embeddings de Chroma)
+      - latencia media de búsqueda (sin contar el embedding de la pregunta)
+      - tamaño en disco total de cada almacenamiento (vectores + docs.jsonl)
+    """
+    check_config()
+
+    idx_path = latest_index_dir()
+    if idx_path is None:
+        print("No hay índice. Ejecuta antes: python -m app.index")
+        return
+
+    chroma_vs = load_vectorstore(idx_path, storage="chroma", read_only=False)
+    stores = {}
+    for mode in MODES:
+        if not has_compact_store(idx_path, mode):
+            compact_from_chroma(idx_path, mode=mode)
+        stores[mode] = CompactVectorStore(compact_dir(idx_path, mode))
+
+    preguntas = []
+    with IN_CSV.open("r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            preguntas.append({"id": row["id"], "pregunta": row["pregunta"].strip()})
+
+    embeddings = chroma_vs.embeddings
+    # Verdad de referencia: búsqueda exacta float32 sobre los embeddings guardados en Chroma
+    data = chroma_vs._collection.get(include=["embeddings"])
+    ref_ids = data["ids"]
+    ref_mat = np.asarray(data["embeddings"], dtype=np.float32)
+    ref_mat /= np.maximum(np.linalg.norm(ref_mat, axis=1, keepdims=True), 1e-12)
+    rows_out = []
+    agg = {m: {"rec_chroma": 0.0, "rec_exact": 0.0, "t_ms": 0.0} for m in MODES + ["chroma"]}
+
+    for item in preguntas:
+        qvec = embeddings.embed_query(item["pregunta"])
+
+        t0 = time.perf_counter()
+        res = chroma_vs._collection.query(query_embeddings=[qvec], n_results=K, include=[])
+        agg["chroma"]["t_ms"] += (time.perf_counter() - t0) * 1000.0
+        chroma_ids = res["ids"][0]
+
+        exact_scores = ref_mat @ np.asarray(qvec, dtype=np.float32)
+        exact_ids = [ref_ids[i] for i in np.argsort(-exact_scores)[:K]]
+        agg["chroma"]["rec_exact"] += _recall(chroma_ids, exact_ids)
+        agg["chroma"]["rec_chroma"] += 1.0
+
+        for mode, store in stores.items():
+            t0 = time.perf_counter()
+            hits = store.search_rows(qvec, k=K)
+            dt = (time.perf_counter() - t0) * 1000.0
+            ids = store.ids_for_rows([r for r, _ in hits])
+            r_chroma = _recall(ids, chroma_ids)
+            r_exact = _recall(ids, exact_ids)
+            agg[mode]["t_ms"] += dt
+            agg[mode]["rec_chroma"] += r_chroma
+            agg[mode]["rec_exact"] += r_exact
+            rows_out.append({
+                "id": item["id"],
+                "modo": mode,
+                "recall_vs_chroma": f"{r_chroma:.3f}",
+                "recall_vs_exacto": f"{r_exact:.3f}",
+                "tiempo_busqueda_ms": f"{dt:.2f}",
+            })
+
+    with OUT_CSV.open("w", encoding="utf-8", newline="") as f:
+        fieldnames = ["id", "modo", "recall_vs_chroma", "recall_vs_exacto", "tiempo_busqueda_ms"]
+        w = csv.DictWriter(f, fieldnames=fieldnames)
+        w.writeheader()
+        for r in rows_out:
+            w.writerow(r)
+
+    n = len(preguntas) or 1
+    chroma_bytes = sum(
+        p.stat().st_size for p in idx_path.rglob("*")
+        if p.is_file() and not any(part.startswith("compact_") or part == "chunks" for part in p.relative_to(idx_path).parts)
+    )
+    chunks_dir = idx_path / "chunks"
+    chunks_bytes = _dir_size(chunks_dir) if chunks_dir.exists() else 0
+    print("\n[RESUMEN]")
+    print(f"Índice: {idx_path.name}   Preguntas: {len(preguntas)}   k={K}")
+    print(f"Referencia float32 sin índice: {ref_mat.nbytes/1e6:.1f} MB   "
+          f"chunks/ (texto, compartido por todos los modos): {chunks_bytes/1e6:.1f} MB")
+    print(f"{'modo':<8} {'recall@k vs chroma':>19} {'recall@k vs exacto':>19} {'busqueda ms':>12} {'disco MB':>9}")
+    for mode in ["chroma"] + MODES:
+        a = agg[mode]
+        size = chroma_bytes if mode == "chroma" else _dir_size(compact_dir(idx_path, mode))
+        print(
+            f"{mode:<8} {a['rec_chroma']/n:>19.3f} {a['rec_exact']/n:>19.3f} "
+            f"{a['t_ms']/n:>12.2f} {size/1e6:>9.1f}"
+        )
+    print(f"Guardado: {OUT_CSV.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
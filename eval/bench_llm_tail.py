@@ -0,0 +1,58 @@
+import argparse, time
+import sys, os
+
+# Añadir el parent al sys.path para importar app.*
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(
+        description="Latencia de cola del LLM con y sin hedging (usar con eval/fake_llm_server.py)."
+    )
+    ap.add_argument("--base-url", default="http://127.0.0.1:8765/v1", help="'' para usar la API real")
+    ap.add_argument("--n", type=int, default=100, help="llamadas por modo")
+    ap.add_argument("--deadline-s", type=float, default=10.0)
+    return ap.parse_args()
+
+
+def _pct(xs, p):
+    if not xs:
+        return 0.0
+    xs = sorted(xs)
+    return xs[min(len(xs) - 1, int(len(xs) * p / 100.0))]
+
+
+def main():
+    args = _parse_args()
+    # La configuración se lee al importar app.config: fijar el endpoint antes
+    if args.base_url:
+        os.environ["OPENAI_BASE_URL"] = args.base_url
+        os.environ.setdefault("OPENAI_API_KEY", "sk-fake-local")
+
+    from langchain_core.messages import HumanMessage
+    from app.llm import LLMTimeoutError, invoke_llm, llm_stats
+
+    messages = [HumanMessage(content="¿Qué dice el documento sobre vacaciones?")]
+    print(f"[TAIL] Endpoint: {args.base_url or 'OpenAI'}   llamadas por modo: {args.n}")
+
+    for hedge in (False, True):
+        before = llm_stats()
+        tiempos, timeouts = [], 0
+        for _ in range(args.n):
+            t0 = time.perf_counter()
+            try:
+                invoke_llm(messages, deadline_s=args.deadline_s, hedge=hedge)
+            except LLMTimeoutError:
+                timeouts += 1
+            tiempos.append((time.perf_counter() - t0) * 1000.0)
+        after = llm_stats()
+        delta = {k: after[k] - before[k] for k in ("calls", "hedges", "hedge_wins", "cancellations", "timeouts")}
+        print(f"\n== hedge={'ON' if hedge else 'OFF'} ==")
+        print(f"p50={_pct(tiempos, 50):.0f} ms  p95={_pct(tiempos, 95):.0f} ms  p99={_pct(tiempos, 99):.0f} ms  "
+              f"max={max(tiempos):.0f} ms  timeouts={timeouts}")
+        print(f"hedges={delta['hedges']}  ganados por respaldo={delta['hedge_wins']}  "
+              f"cancelaciones={delta['cancellations']}  retardo de hedge actual={after['hedge_delay_s']} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Servidor local compatible con /v1/chat/completions (OpenAI) que inyecta latencia.
+Sirve para verificar timeouts y hedging sin gastar cuota:
+
+    python eval\\fake_llm_server.py --port 8765 --base-ms 300 --slow-ms 8000 --slow-prob 0.1
+
+y apuntar la app con OPENAI_BASE_URL=http://127.0.0.1:8765/v1 (y cualquier OPENAI_API_KEY).
+"""
+import argparse, json, random, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ARGS = None
+_LOCK = threading.Lock()
+_COUNT = {"requests": 0, "slow": 0, "disconnects": 0}
+
+RESPUESTA = "No dispongo de datos suficientes en el contexto para responder a esa pregunta."
+
+
+def _delay_s() -> float:
+    """Latencia hasta el primer token: base +- jitter, y con probabilidad slow_prob, cola lenta."""
+    base = ARGS.base_ms + random.uniform(-ARGS.jitter_ms, ARGS.jitter_ms)
+    if random.random() < ARGS.slow_prob:
+        with _LOCK:
+            _COUNT["slow"] += 1
+        base = ARGS.slow_ms
+    return max(0.0, base) / 1000.0
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, fmt, *args):  # silencioso
+        pass
+
+    def do_GET(self):
+        body = json.dumps(_COUNT).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        req = json.loads(self.rfile.read(length) or b"{}")
+        with _LOCK:
+            _COUNT["requests"] += 1
+        model = req.get("model", "fake")
+        created = int(time.time())
+        words = RESPUESTA.split(" ")
+        time.sleep(_delay_s())
+
+        if not req.get("stream"):
+            body = json.dumps({
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": RESPUESTA}}],
+                "usage": {"prompt_tokens": 100, "completion_tokens": len(words), "total_tokens": 100 + len(words)},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        try:
+            for i, w in enumerate(words):
+                delta = {"role": "assistant", "content": w if i == 0 else " " + w}
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                         "model": model, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(ARGS.token_ms / 1000.0)
+            last = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [],
+                    "usage": {"prompt_tokens": 100, "completion_tokens": len(words), "total_tokens": 100 + len(words)}}
+            self.wfile.write(f"data: {json.dumps(last)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            with _LOCK:
+                _COUNT["disconnects"] += 1
+        self.close_connection = True
+
+
+def main():
+    global ARGS
+    ap = argparse.ArgumentParser(description="Servidor OpenAI falso con latencia inyectada.")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--base-ms", type=float, default=300.0, help="latencia típica hasta el primer token")
+    ap.add_argument("--jitter-ms", type=float, default=100.0)
+    ap.add_argument("--slow-ms", type=float, default=8000.0, help="latencia de la cola lenta")
+    ap.add_argument("--slow-prob", type=float, default=0.1, help="probabilidad de petición lenta")
+    ap.add_argument("--token-ms", type=float, default=5.0, help="pausa entre tokens en streaming")
+    ARGS = ap.parse_args()
+
+    srv = ThreadingHTTPServer((ARGS.host, ARGS.port), Handler)
+    print(f"[FAKE-LLM] Escuchando en http://{ARGS.host}:{ARGS.port}/v1 (GET / para contadores)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,37 @@
+import argparse
 import csv
+import json
 import re
 from pathlib import Path
-from typing import Dict, Any, Tuple, Optional
+from typing import Dict, Any, List, Tuple, Optional
+
+import numpy as np
 
 EVAL_DIR = Path("eval")
+PREGUNTAS_CSV = EVAL_DIR / "preguntas.csv"
+
+def parse_fuentes_esperadas(s: str) -> List[Tuple[str, Optional[int]]]:
+    """
+    Columna opcional `fuentes_esperadas` de preguntas.csv: referencias separadas por ';'
+    con formato "archivo.pdf" o "archivo.pdf:pagina" (página 1-based).
+    """
+    refs = []
+    for part in (s or "").split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        m = re.match(r"^(.*?)(?::(\d+))?$", part)
+        archivo = m.group(1).strip().replace("\\", "/").split("/")[-1]
+        pagina = int(m.group(2)) if m.group(2) else None
+        refs.append((archivo, pagina))
+    return refs
+
+def fuente_coincide(fuente: Dict[str, Any], ref: Tuple[str, Optional[int]]) -> bool:
+    """Una fuente de fuentes_json ({archivo, pagina}) coincide con la referencia (archivo[, pagina])."""
+    archivo, pagina = ref
+    if (fuente.get("archivo") or "").lower() != archivo.lower():
+        return False
+    return pagina is None or str(fuente.get("pagina")) == str(pagina)
 
 def _to_float(x: str) -> float:
     if x is None:
@@ -41,10 +69,10 @@ def _accumulate(row: Dict[str, str], acc: Dict[str, Any]) -> None:
 def _make_acc() -> Dict[str, Any]:
     return {"total": 0, "ok": 0, "parcial": 0, "ok_equiv": 0.0, "t_sum": 0.0}
 
-def _fmt(acc: Dict[str, Any]) -> Tuple[str, str, str]:
+def _fmt(acc: Dict[str, Any]) -> Tuple[str, str, str, str]:
     total = acc["total"] or 0
     if total == 0:
-        return ("0/0 (0.0%)", "0", "0 ms")
+        return ("0/0 (0.0%)", "0", "0.0%", "0 ms")
     ok = acc["ok"]
     parc = acc["parcial"]
     ok_equiv = acc["ok_equiv"]
@@ -55,26 +83,229 @@ def _fmt(acc: Dict[str, Any]) -> Tuple[str, str, str]:
     tiempo = f"{t_med:.0f} ms"
     return exactas, parciales, acc_equiv, tiempo
 
+# -------------------------
+# Métricas de recuperación automáticas (recall@k, MRR, nDCG) a partir de fuentes_json
+# -------------------------
+def _gold_por_id(path: Path = PREGUNTAS_CSV) -> Dict[str, str]:
+    """id -> fuentes_esperadas de preguntas.csv (si la columna existe)."""
+    if not path.exists():
+        return {}
+    with path.open("r", encoding="utf-8") as f:
+        return {
+            row["id"]: row.get("fuentes_esperadas") or ""
+            for row in csv.DictReader(f)
+            if row.get("fuentes_esperadas")
+        }
+
+def _relevancias(fuentes: List[Dict[str, Any]], refs: List[Tuple[str, Optional[int]]]) -> List[int]:
+    """
+    Relevancia binaria por rango. Cada referencia esperada cuenta una sola vez
+    (la misma página recuperada dos veces no suma dos aciertos).
+    """
+    usadas = set()
+    rel = []
+    for fuente in fuentes:
+        hit = 0
+        for j, ref in enumerate(refs):
+            if j not in usadas and fuente_coincide(fuente, ref):
+                usadas.add(j)
+                hit = 1
+                break
+        rel.append(hit)
+    return rel
+
+def metricas_recuperacion(
+    rows: List[Dict[str, str]],
+    gold_por_id: Dict[str, str],
+    k: Optional[int] = None,
+) -> Dict[str, Dict[str, float]]:
+    """
+    Calcula recall@k, MRR y nDCG@k por índice (columna `indice`) y global.
+    Solo cuentan las filas con referencias esperadas (columna fuentes_esperadas del
+    propio CSV de resultados o, si no está, de preguntas.csv por id).
+    Las filas con estado error / rejected / partial no tienen fuentes fiables: no se puntúan
+    y se cuentan en "omitidas" (una caída de la API no es una regresión de recuperación).
+    """
+    rels: List[List[int]] = []
+    n_gold: List[int] = []
+    indices: List[str] = []
+    omitidas: Dict[str, int] = {}
+    for row in rows:
+        refs = parse_fuentes_esperadas(row.get("fuentes_esperadas") or gold_por_id.get(row.get("id", ""), ""))
+        if not refs:
+            continue
+        if (row.get("estado") or "ok") not in ("ok", "no_answer"):
+            idx = row.get("indice") or "SIN_INDICE"
+            omitidas[idx] = omitidas.get(idx, 0) + 1
+            continue
+        try:
+            fuentes = json.loads(row.get("fuentes_json") or "[]")
+        except json.JSONDecodeError:
+            fuentes = []
+        rels.append(_relevancias(fuentes, refs))
+        n_gold.append(len(refs))
+        indices.append(row.get("indice") or "SIN_INDICE")
+
+    if not rels:
+        if not omitidas:
+            return {}
+        out_vacio: Dict[str, Dict[str, float]] = {g: {"n": 0, "omitidas": c} for g, c in omitidas.items()}
+        out_vacio["GLOBAL"] = {"n": 0, "omitidas": sum(omitidas.values())}
+        return out_vacio
+
+    k_max = max(len(r) for r in rels) or 1
+    k = min(k or k_max, k_max)
+    # Matriz de relevancias (filas = preguntas de todas las corridas, columnas = rango)
+    R = np.zeros((len(rels), k_max), dtype=np.float64)
+    for i, r in enumerate(rels):
+        R[i, : len(r)] = r
+    R = R[:, :k]
+    G = np.asarray(n_gold, dtype=np.float64)
+
+    recall = R.sum(axis=1) / G
+    hits = R > 0
+    first = hits.argmax(axis=1)
+    mrr = np.where(hits.any(axis=1), 1.0 / (first + 1), 0.0)
+    disc = 1.0 / np.log2(np.arange(2, k + 2))
+    dcg = (R * disc).sum(axis=1)
+    ideal_n = np.minimum(G, k).astype(int)
+    idcg = np.cumsum(disc)[ideal_n - 1]
+    ndcg = dcg / idcg
+
+    grupos, inv = np.unique(np.asarray(indices), return_inverse=True)
+    counts = np.bincount(inv)
+    out: Dict[str, Dict[str, float]] = {}
+    for nombre, valores in (("recall", recall), ("mrr", mrr), ("ndcg", ndcg)):
+        medias = np.bincount(inv, weights=valores) / counts
+        for g, m in zip(grupos, medias):
+            out.setdefault(str(g), {"n": 0, "k": k})[nombre] = float(m)
+        out.setdefault("GLOBAL", {"n": len(rels), "k": k})[nombre] = float(valores.mean())
+    for g, c in zip(grupos, counts):
+        out[str(g)]["n"] = int(c)
+    for g, c in omitidas.items():
+        out.setdefault(g, {"n": 0, "k": k})["omitidas"] = c
+    for g in out:
+        out[g].setdefault("omitidas", 0)
+    out["GLOBAL"]["omitidas"] = sum(omitidas.values())
+    return out
+
+# -------------------------
+# Umbral de confianza (RAG_MIN_SCORE): llamadas al LLM ahorradas vs. acierto
+# -------------------------
+_SIN_DATOS_RE = re.compile(
+    r"no (se )?dispon|no hay (suficiente )?informaci|informaci[oó]n suficiente|datos suficientes",
+    re.IGNORECASE,
+)
+
+def _es_sin_datos(respuesta: str) -> bool:
+    return bool(_SIN_DATOS_RE.search(respuesta or ""))
+
+def calibrar_umbral(rows: List[Dict[str, str]]) -> Dict[str, Any]:
+    """
+    Usa corridas SIN umbral (todas las preguntas pasaron por el LLM) con `score_max`.
+    Cortar una pregunta es inocuo si el LLM ya respondió "sin datos" o la respuesta se
+    marcó incorrecta (0); es una pérdida si la respuesta era útil. Devuelve la tabla
+    umbral -> (ahorradas, perdidas) y el mayor umbral sin pérdidas.
+    """
+    puntos = []
+    for row in rows:
+        if (row.get("estado") or "ok") != "ok" or not (row.get("score_max") or "").strip():
+            continue
+        marca = (row.get("correcta(0/1)") or "").strip()
+        util = not _es_sin_datos(row.get("respuesta", "")) and (not marca or _to_float(marca) > 0)
+        puntos.append((_to_float(row["score_max"]), util))
+    if not puntos:
+        return {}
+
+    scores = np.array([p[0] for p in puntos])
+    util = np.array([p[1] for p in puntos], dtype=bool)
+    # Con umbral t se cortan las preguntas con score < t
+    candidatos = np.unique(np.append(scores, scores.max() + 1e-4))
+    tabla = [(float(t), int((scores < t).sum()), int(((scores < t) & util).sum())) for t in candidatos]
+    sin_perdidas = [t for t in tabla if t[2] == 0]
+    return {"n": len(puntos), "tabla": tabla, "recomendado": sin_perdidas[-1] if sin_perdidas else None}
+
+def _print_umbral(rows: List[Dict[str, str]]) -> None:
+    grupos: Dict[str, Dict[str, Any]] = {}
+    for row in rows:
+        u = str(row.get("umbral") or "").strip() or "sin umbral"
+        acc = grupos.setdefault(u, {**_make_acc(), "no_answer": 0})
+        _accumulate(row, acc)
+        acc["no_answer"] += (row.get("estado") == "no_answer")
+    if any(u != "sin umbral" for u in grupos):
+        print("\n== POR UMBRAL DE CONFIANZA ==")
+        print(f"{'umbral':<12} {'n':>4} {'LLM ahorradas':>14} {'acierto eq.':>12} {'tiempo medio':>13}")
+        for u, acc in sorted(grupos.items()):
+            _, _, ae, tm = _fmt(acc)
+            print(f"{u:<12} {acc['total']:>4} {acc['no_answer']:>14} {ae:>12} {tm:>13}")
+
+    cal = calibrar_umbral([r for r in rows if not str(r.get("umbral") or "").strip()])
+    if not cal:
+        return
+    print(f"\n== CALIBRACIÓN DEL UMBRAL ({cal['n']} preguntas sin umbral) ==")
+    print(f"{'umbral':>8} {'ahorradas':>10} {'perdidas':>9}")
+    for t, ahorradas, perdidas in cal["tabla"]:
+        print(f"{t:>8.4f} {ahorradas:>10} {perdidas:>9}")
+    rec = cal["recomendado"]
+    if rec and rec[1] > 0:
+        print(f"Sugerencia: RAG_MIN_SCORE={rec[0]:.4f} (ahorra {rec[1]} llamadas sin perder respuestas útiles)")
+    else:
+        print("Ningún umbral ahorra llamadas sin perder respuestas útiles en estas corridas.")
+
+def _leer_filas(paths: List[Path]) -> List[Dict[str, str]]:
+    filas = []
+    for p in paths:
+        with p.open("r", encoding="utf-8") as f:
+            filas.extend(csv.DictReader(f))
+    return filas
+
+def _print_recuperacion(met: Dict[str, Dict[str, float]]) -> None:
+    if not met:
+        print("\n== RECUPERACIÓN ==")
+        print("Sin fuentes esperadas (añade la columna 'fuentes_esperadas' en preguntas.csv).")
+        return
+    g = met["GLOBAL"]
+    print(f"\n== RECUPERACIÓN (k={g.get('k', '-')}) ==")
+    print(f"{'indice':<28} {'n':>4} {'recall@k':>9} {'MRR':>6} {'nDCG@k':>7} {'omitidas':>9}")
+    for idx in sorted(k for k in met if k != "GLOBAL") + ["GLOBAL"]:
+        m = met[idx]
+        if not m["n"]:
+            print(f"{idx:<28} {0:>4} {'-':>9} {'-':>6} {'-':>7} {m['omitidas']:>9}")
+            continue
+        print(f"{idx:<28} {m['n']:>4} {m['recall']:>9.3f} {m['mrr']:>6.3f} {m['ndcg']:>7.3f} {m['omitidas']:>9}")
+    if g["omitidas"]:
+        print(f"Omitidas {g['omitidas']} filas con estado error/rejected/partial (sin fuentes fiables).")
+
 def main():
-    csv_path = _latest_resultados_csv()
-    if not csv_path:
+    ap = argparse.ArgumentParser(description="Métricas de eval: acierto manual + recuperación automática.")
+    ap.add_argument("csv", nargs="*", type=Path, help="CSV de resultados (por defecto, el más reciente)")
+    ap.add_argument("--todos", action="store_true", help="Usa todos los eval/resultados_*.csv (comparar índices)")
+    ap.add_argument("--k", type=int, default=None, help="Corte para recall@k / nDCG@k (por defecto, todas las fuentes)")
+    args = ap.parse_args()
+
+    if args.csv:
+        paths = list(args.csv)
+    elif args.todos:
+        paths = sorted(EVAL_DIR.glob("resultados_*.csv"))
+    else:
+        latest = _latest_resultados_csv()
+        paths = [latest] if latest else []
+    if not paths:
         print("No se encontró ningún CSV de resultados en eval/. Ejecuta antes run_eval.py.")
         return
 
-    print(f"Archivo: {csv_path}")
+    print(f"Archivo: {', '.join(str(p) for p in paths)}")
+    filas = _leer_filas(paths)
 
     global_acc = _make_acc()
     per_index: Dict[str, Dict[str, Any]] = {}
 
-    with csv_path.open("r", encoding="utf-8") as f:
-        r = csv.DictReader(f)
-        has_indice = "indice" in (r.fieldnames or [])
-        for row in r:
-            idx = row.get("indice", "SIN_INDICE") if has_indice else "SIN_INDICE"
-            if idx not in per_index:
-                per_index[idx] = _make_acc()
-            _accumulate(row, global_acc)
-            _accumulate(row, per_index[idx])
+    for row in filas:
+        idx = row.get("indice") or "SIN_INDICE"
+        if idx not in per_index:
+            per_index[idx] = _make_acc()
+        _accumulate(row, global_acc)
+        _accumulate(row, per_index[idx])
 
     # Global
     ex, pa, ae, tm = _fmt(global_acc)
@@ -97,5 +328,8 @@ def main():
             print(f"  Acierto equivalente: {aei}")
             print(f"  Tiempo medio: {tmi}")
 
+    _print_recuperacion(metricas_recuperacion(filas, _gold_por_id(), k=args.k))
+    _print_umbral(filas)
+
 if __name__ == "__main__":
     main()
@@ -7,8 +7,9 @@ import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))
 
 from app.rag import ask_question, format_answer  # pipeline RAG
-from app.config import check_config
+from app.config import check_config, RAG_MIN_SCORE  # umbral de confianza activo (o None)
 from app.index import latest_index_dir  # para anotar qué índice se ha usado
+from app.embed_cache import cache_stats  # aciertos/fallos de la cache de embeddings
 
 # Parámetros de prueba (ajústalos si quieres)
 K = 4
@@ -23,6 +24,20 @@ OUT_CSV = EVAL_DIR / f"resultados_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv
 IN_CSV = EVAL_DIR / "preguntas.csv"
 
 
+def serializar_fuentes(ctx):
+    """Serializa las fuentes de forma compacta (archivo + página)."""
+    fuentes = []
+    for i, d in enumerate(ctx, start=1):
+        meta = d.metadata or {}
+        source = (meta.get("source") or "").replace("\\", "/").split("/")[-1]
+        page_display = meta.get("page_display")
+        if page_display is None:
+            p = meta.get("page")
+            page_display = p + 1 if isinstance(p, int) else "N/A"
+        fuentes.append({"i": i, "archivo": source, "pagina": page_display})
+    return fuentes
+
+
 def main():
     check_config()
 
@@ -35,7 +50,11 @@ def main():
     with IN_CSV.open("r", encoding="utf-8") as f:
         reader = csv.DictReader(f)
         for row in reader:
-            preguntas.append({"id": row["id"], "pregunta": row["pregunta"]})
+            preguntas.append({
+                "id": row["id"],
+                "pregunta": row["pregunta"],
+                "fuentes_esperadas": row.get("fuentes_esperadas") or "",
+            })
 
     rows_out = []
     t_total = 0.0
@@ -53,24 +72,19 @@ def main():
         ans = result.get("answer", "").strip()
         ctx = result.get("context", [])
 
-        # Serializar fuentes de forma compacta (archivo + página)
-        fuentes = []
-        for i, d in enumerate(ctx, start=1):
-            meta = d.metadata or {}
-            source = (meta.get("source") or "").replace("\\", "/").split("/")[-1]
-            page_display = meta.get("page_display")
-            if page_display is None:
-                p = meta.get("page")
-                page_display = p + 1 if isinstance(p, int) else "N/A"
-            fuentes.append({"i": i, "archivo": source, "pagina": page_display})
+        fuentes = serializar_fuentes(ctx)
 
         rows_out.append({
             "indice": idx_name,                      # <-- índice usado en esta corrida
             "id": qid,
             "pregunta": q,
             "tiempo_ms": f"{dt:.0f}",
+            "estado": result.get("status", ""),     # ok / no_answer / partial / rejected / error
+            "score_max": "" if result.get("score") is None else f"{result['score']:.4f}",
+            "umbral": "" if RAG_MIN_SCORE is None else RAG_MIN_SCORE,
             "respuesta": ans,
             "fuentes_json": json.dumps(fuentes, ensure_ascii=False),
+            "fuentes_esperadas": item["fuentes_esperadas"],  # <-- referencias gold (opcional)
             "correcta(0/1)": "",                     # <-- la marcas a mano (1 / 0 / 0.5)
             "comentario": ""
         })
@@ -81,7 +95,7 @@ def main():
 
     # Guardar CSV resultados (con índice y timestamp)
     with OUT_CSV.open("w", encoding="utf-8", newline="") as f:
-        fieldnames = ["indice","id","pregunta","tiempo_ms","respuesta","fuentes_json","correcta(0/1)","comentario"]
+        fieldnames = ["indice","id","pregunta","tiempo_ms","estado","score_max","umbral","respuesta","fuentes_json","fuentes_esperadas","correcta(0/1)","comentario"]
         w = csv.DictWriter(f, fieldnames=fieldnames)
         w.writeheader()
         for r in rows_out:
@@ -92,6 +106,14 @@ def main():
     print(f"Índice:  {idx_name}")
     print(f"Preguntas: {len(rows_out)}")
     print(f"Tiempo medio: {t_total/len(rows_out):.0f} ms")
+    if RAG_MIN_SCORE is not None:
+        ahorradas = sum(1 for r in rows_out if r["estado"] == "no_answer")
+        print(f"Umbral de confianza: {RAG_MIN_SCORE}  llamadas al LLM ahorradas: {ahorradas}/{len(rows_out)}")
+    for model, info in cache_stats().items():
+        print(
+            f"Cache embeddings ({model}): memoria={info['hits_memory']} "
+            f"disco={info['hits_disk']} fallos={info['misses']}"
+        )
     print(f"Guardado: {OUT_CSV.resolve()}")
 
 
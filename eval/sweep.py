@@ -0,0 +1,227 @@
+import argparse, csv, itertools, time
+from collections import Counter
+from pathlib import Path
+from datetime import datetime
+import sys, os
+
+# Añadir el parent al sys.path para importar app.*
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.rag import ask_question, retrieve_documents, build_prompt
+from app.config import check_config, DEFAULT_EMBED_MODEL, INDEX_STORAGE
+from app.embed_cache import get_query_embeddings
+from app.index import build_index, find_index
+from app.ingest import INGEST_DEDUP
+
+from metricas import parse_fuentes_esperadas, fuente_coincide
+from run_eval import serializar_fuentes
+
+EVAL_DIR = Path("eval")
+EVAL_DIR.mkdir(exist_ok=True)
+
+OUT_CSV = EVAL_DIR / f"sweep_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv"
+IN_CSV = EVAL_DIR / "preguntas.csv"
+TEMP = 0.1
+
+
+def _ints(s: str):
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def _floats(s: str):
+    return [float(x) for x in s.split(",") if x.strip()]
+
+
+def _parse_args():
+    ap = argparse.ArgumentParser(
+        description="Barrido calidad/latencia sobre chunking (índices) y parámetros de recuperación."
+    )
+    ap.add_argument("--chunk-sizes", type=_ints, default=[800, 1200])
+    ap.add_argument("--overlaps", type=_ints, default=[100, 200])
+    ap.add_argument("--ks", type=_ints, default=[2, 4, 6])
+    ap.add_argument("--mmr", type=_ints, default=[0, 1], help="0 = similitud, 1 = MMR")
+    ap.add_argument("--fetch-ks", type=_ints, default=[8, 16], help="solo con MMR")
+    ap.add_argument("--lambdas", type=_floats, default=[0.5], help="solo con MMR")
+    ap.add_argument(
+        "--solo-recuperacion",
+        action="store_true",
+        help="No llama al LLM: mide solo recuperación y estima los tokens del prompt (~4 caracteres/token).",
+    )
+    ap.add_argument("--no-build", action="store_true", help="No construir índices que falten.")
+    return ap.parse_args()
+
+
+def _retrieval_grid(args):
+    """Combinaciones (k, use_mmr, fetch_k, lambda_mult); sin MMR fetch_k/lambda no aplican."""
+    grid = []
+    for k, mmr in itertools.product(args.ks, args.mmr):
+        if mmr:
+            for fk, lm in itertools.product(args.fetch_ks, args.lambdas):
+                if fk >= k:
+                    grid.append((k, True, fk, lm))
+        else:
+            grid.append((k, False, None, 0.5))
+    return grid
+
+
+def _pareto(rows):
+    """
+    Filas no dominadas en (acierto_recuperacion ↑, tiempo_medio_ms ↓, tokens_prompt ↓).
+    Las configuraciones sin ninguna respuesta "ok" no entran (sus medias no significan nada).
+    """
+    rows = [r for r in rows if r["respuestas_ok"] > 0]
+    def key(r):
+        return (r["acierto_recuperacion"], -r["tiempo_medio_ms"], -r["tokens_prompt_medio"])
+
+    front = []
+    for r in rows:
+        kr = key(r)
+        dominated = any(
+            all(a >= b for a, b in zip(key(o), kr)) and key(o) != kr for o in rows if o is not r
+        )
+        if not dominated:
+            front.append(r)
+    return sorted(front, key=lambda r: (r["tokens_prompt_medio"], r["tiempo_medio_ms"]))
+
+
+def main():
+    args = _parse_args()
+    check_config()
+
+    preguntas = []
+    with IN_CSV.open("r", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            preguntas.append({
+                "id": row["id"],
+                "pregunta": row["pregunta"].strip(),
+                "gold": parse_fuentes_esperadas(row.get("fuentes_esperadas", "")),
+            })
+    n_gold = sum(1 for p in preguntas if p["gold"])
+    if n_gold == 0:
+        print("[SWEEP] Aviso: preguntas.csv no tiene 'fuentes_esperadas'; el acierto de recuperación será 0.")
+
+    # Calentar la cache de embeddings de consulta antes de medir: si no, la primera configuracion
+    # paga la llamada a la API por cada pregunta y las siguientes no, y el tiempo no es comparable
+    t0 = time.perf_counter()
+    query_emb = get_query_embeddings(DEFAULT_EMBED_MODEL)
+    for item in preguntas:
+        query_emb.embed_query(item["pregunta"])
+    print(f"[SWEEP] Embeddings de {len(preguntas)} preguntas precalculados en "
+          f"{(time.perf_counter() - t0) * 1000.0:.0f} ms (fuera de los tiempos medidos).")
+
+    prompt_tpl = build_prompt()
+    summary = []
+
+    for chunk_size, overlap in itertools.product(args.chunk_sizes, args.overlaps):
+        if overlap >= chunk_size:
+            continue
+        # Chunking plano (se barre chunk_size) con la deduplicación y el almacenamiento actuales
+        idx = find_index(
+            chunk_size=chunk_size,
+            chunk_overlap=overlap,
+            embed_model=DEFAULT_EMBED_MODEL,
+            parent_unit=None,
+            dedup=INGEST_DEDUP,
+            storage=INDEX_STORAGE,
+        )
+        if idx is None:
+            if args.no_build:
+                print(f"[SWEEP] Sin índice para chunk_size={chunk_size}, overlap={overlap}; se omite.")
+                continue
+            idx = build_index(
+                chunk_size=chunk_size, chunk_overlap=overlap, parent_unit="",
+                dedup=INGEST_DEDUP, storage=INDEX_STORAGE,
+            )
+        print(f"\n[SWEEP] Índice {idx.name} (chunk_size={chunk_size}, overlap={overlap})")
+
+        for k, use_mmr, fetch_k, lambda_mult in _retrieval_grid(args):
+            tiempos, tokens, hits = [], [], []
+            estados = Counter()
+            for item in preguntas:
+                t0 = time.perf_counter()
+                if args.solo_recuperacion:
+                    docs = retrieve_documents(
+                        item["pregunta"], k=k, use_mmr=use_mmr,
+                        fetch_k=fetch_k, lambda_mult=lambda_mult, persist_dir=idx,
+                    )
+                    dt = (time.perf_counter() - t0) * 1000.0
+                    context_text = "\n\n".join(d.page_content for d in docs)
+                    msgs = prompt_tpl.format_messages(context=context_text, input=item["pregunta"])
+                    n_tok = sum(len(m.content) for m in msgs) / 4.0
+                    estados["ok"] += 1
+                else:
+                    # Sin umbral de confianza: se mide la configuración, no la decisión de abstenerse
+                    result = ask_question(
+                        item["pregunta"], k=k, temperature=TEMP, use_mmr=use_mmr,
+                        fetch_k=fetch_k, lambda_mult=lambda_mult, persist_dir=idx, min_score=None,
+                    )
+                    dt = (time.perf_counter() - t0) * 1000.0
+                    estado = result.get("status", "ok")
+                    estados[estado] += 1
+                    # error / rejected / partial / no_answer no son medidas validas de latencia ni tokens
+                    if estado != "ok":
+                        continue
+                    docs = result.get("context", [])
+                    n_tok = float((result.get("usage") or {}).get("prompt_tokens", 0))
+                tiempos.append(dt)
+                tokens.append(n_tok)
+                if item["gold"]:
+                    fuentes = serializar_fuentes(docs)
+                    hits.append(
+                        any(fuente_coincide(f, ref) for f in fuentes for ref in item["gold"])
+                    )
+
+            tiempos_ord = sorted(tiempos)
+            n = len(tiempos) or 1
+            row = {
+                "indice": idx.name,
+                "chunk_size": chunk_size,
+                "chunk_overlap": overlap,
+                "k": k,
+                "use_mmr": int(use_mmr),
+                "fetch_k": fetch_k if use_mmr else "",
+                "lambda_mult": lambda_mult if use_mmr else "",
+                "acierto_recuperacion": round(sum(hits) / len(hits), 3) if hits else 0.0,
+                "tiempo_medio_ms": round(sum(tiempos) / n, 0),
+                "tiempo_p95_ms": round(tiempos_ord[min(len(tiempos_ord) - 1, int(0.95 * len(tiempos_ord)))], 0)
+                if tiempos_ord else 0,
+                "tokens_prompt_medio": round(sum(tokens) / n, 0),
+                "tokens_estimados": int(args.solo_recuperacion),
+                "respuestas_ok": len(tiempos),
+                "excluidas": sum(c for e, c in estados.items() if e != "ok"),
+                "estados_excluidos": ",".join(f"{e}:{c}" for e, c in sorted(estados.items()) if e != "ok"),
+            }
+            summary.append(row)
+            print(
+                f"  k={k} mmr={int(use_mmr)} fetch_k={row['fetch_k']} lambda={row['lambda_mult']} -> "
+                f"acierto={row['acierto_recuperacion']} t={row['tiempo_medio_ms']:.0f} ms "
+                f"tokens={row['tokens_prompt_medio']:.0f}"
+                + (f" (excluidas {row['excluidas']}: {row['estados_excluidos']})" if row["excluidas"] else "")
+            )
+
+    if not summary:
+        print("[SWEEP] No se ha evaluado ninguna configuración.")
+        return
+
+    front = _pareto(summary)
+    for r in summary:
+        r["pareto"] = int(r in front)
+
+    with OUT_CSV.open("w", encoding="utf-8", newline="") as f:
+        w = csv.DictWriter(f, fieldnames=list(summary[0].keys()))
+        w.writeheader()
+        for r in summary:
+            w.writerow(r)
+
+    print("\n[PARETO] (ordenado por tokens de prompt; elige la primera fila con acierto suficiente)")
+    cols = ["chunk_size", "chunk_overlap", "k", "use_mmr", "fetch_k", "lambda_mult",
+            "acierto_recuperacion", "tiempo_medio_ms", "tiempo_p95_ms", "tokens_prompt_medio", "excluidas"]
+    print(" | ".join(cols))
+    for r in front:
+        print(" | ".join(str(r[c]) for c in cols))
+    print(f"\nPreguntas con fuentes esperadas: {n_gold}/{len(preguntas)}")
+    print(f"Configuraciones: {len(summary)}   Guardado: {OUT_CSV.resolve()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+# Añadir el parent al sys.path para importar app.*
+sys.path.append(os.path.dirname(os.path.dirname(__file__)))
+
+from app.admission import AdmissionController, Deadline, OverloadedError, hold_slot
+
+
+def _occupy(ctrl: AdmissionController, n: int) -> None:
+    for _ in range(n):
+        ctrl.acquire()
+
+
+def test_rechaza_al_momento_con_la_cola_llena():
+    ctrl = AdmissionController(max_inflight=1, max_queue=0, queue_timeout_s=5)
+    _occupy(ctrl, 1)
+    t0 = time.monotonic()
+    with pytest.raises(OverloadedError):
+        ctrl.acquire()
+    assert time.monotonic() - t0 < 0.5
+    assert ctrl.stats()["rejected_queue_full"] == 1
+
+
+def test_rechaza_tras_agotar_la_espera_en_cola():
+    ctrl = AdmissionController(max_inflight=1, max_queue=1, queue_timeout_s=0.2)
+    _occupy(ctrl, 1)
+    t0 = time.monotonic()
+    with pytest.raises(OverloadedError):
+        ctrl.acquire()
+    assert 0.15 <= time.monotonic() - t0 < 1.0
+    stats = ctrl.stats()
+    assert stats["rejected_timeout"] == 1
+    assert stats["queue_depth"] == 0
+
+
+def test_la_espera_en_cola_no_pasa_del_plazo_de_la_consulta():
+    ctrl = AdmissionController(max_inflight=1, max_queue=1, queue_timeout_s=10)
+    _occupy(ctrl, 1)
+    t0 = time.monotonic()
+    with pytest.raises(OverloadedError):
+        ctrl.acquire(Deadline(0.2))
+    assert time.monotonic() - t0 < 1.0
+
+
+def test_la_consulta_en_cola_entra_al_liberarse_un_hueco():
+    ctrl = AdmissionController(max_inflight=1, max_queue=1, queue_timeout_s=5)
+    _occupy(ctrl, 1)
+    threading.Timer(0.1, ctrl.release).start()
+    ctrl.acquire(Deadline(2))
+    assert ctrl.stats()["in_flight"] == 1
+
+
+def test_el_trabajo_en_segundo_plano_retiene_el_hueco():
+    ctrl = AdmissionController(max_inflight=1, max_queue=0, queue_timeout_s=0)
+    fut: Future = Future()
+    with ctrl.slot():
+        hold_slot(fut)
+    assert ctrl.stats()["in_flight"] == 1
+    assert ctrl.stats()["deferred_releases"] == 1
+    with pytest.raises(OverloadedError):
+        ctrl.acquire()
+    fut.set_result(None)
+    assert ctrl.stats()["in_flight"] == 0
+    ctrl.acquire()
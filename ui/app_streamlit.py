@@ -10,7 +10,7 @@ import streamlit as st
 
 # Import robusto: si falla INDEX_DIR/RAW_DIR, usamos fallback calculado
 try:
-    from app.rag import retrieve_documents, get_llm, build_prompt, format_answer
+    from app.rag import ask_question, format_answer
     from app.index import build_index
     from app.config import check_config, OPENAI_API_KEY, INDEX_DIR, RAW_DIR
 
@@ -19,7 +19,7 @@ except Exception:
     BASE_DIR = Path(os.path.dirname(os.path.dirname(__file__))).resolve()
     CFG_INDEX_DIR = BASE_DIR / "data" / "index"
     RAW_DIR = BASE_DIR / "data" / "raw"
-    from app.rag import retrieve_documents, get_llm, build_prompt, format_answer
+    from app.rag import ask_question, format_answer
     from app.index import build_index
     from app.config import check_config, OPENAI_API_KEY
 
@@ -86,6 +86,30 @@ with st.sidebar:
     use_mmr = st.checkbox("Diversificar resultados (MMR)", value=True)
     st.caption("A mayor temperatura, respuestas más creativas; a menor, más precisas.")
 
+    st.divider()
+    st.header("Filtros de búsqueda")
+    index_names = sorted(
+        (p.name for p in Path(CFG_INDEX_DIR).glob("index_*") if p.is_dir()), reverse=True
+    )
+    filter_indices = st.multiselect(
+        "Índices a consultar", index_names, default=[], placeholder="El más reciente"
+    )
+    # Lista de PDFs desde data/raw (sin abrir Chroma)
+    pdf_names = sorted(p.name for p in Path(RAW_DIR).glob("*.pdf"))
+    filter_sources = st.multiselect(
+        "Limitar a documentos", pdf_names, default=[], placeholder="Todos"
+    )
+    col_pf, col_pt = st.columns(2)
+    with col_pf:
+        page_from = st.number_input("Página desde", min_value=0, value=0, step=1)
+    with col_pt:
+        page_to = st.number_input("Página hasta", min_value=0, value=0, step=1)
+    st.caption("0 = sin límite.")
+    use_date = st.checkbox("Filtrar por fecha de ingesta", value=False)
+    ingest_range = None
+    if use_date:
+        ingest_range = st.date_input("Rango de ingesta", value=())
+
     st.divider()
     if st.button("🔄 Reconstruir índice"):
         with st.spinner("Indexando documentos..."):
@@ -128,21 +152,33 @@ if ask:
     else:
         with st.spinner("Consultando el índice y generando respuesta..."):
             try:
-                # 1) recuperar docs según k (y MMR si procede)
-                docs = retrieve_documents(question.strip(), k=k_chunks, use_mmr=use_mmr)
-                # 2) contexto con esos docs
-                context_text = "\n\n".join(d.page_content for d in docs)
-                # 3) LLM con temperatura elegida
-                llm = get_llm(temperature=temp)
-                chain = build_prompt() | llm
-                response = chain.invoke(
-                    {"context": context_text, "input": question.strip()}
-                )
-                answer_text = (
-                    response.content if hasattr(response, "content") else str(response)
+                date_from = date_to = None
+                if ingest_range:
+                    date_from = ingest_range[0]
+                    date_to = ingest_range[1] if len(ingest_range) > 1 else None
+                # Recuperación + LLM con plazo y control de admisión (ver app.admission)
+                result = ask_question(
+                    question.strip(),
+                    k=k_chunks,
+                    temperature=temp,
+                    use_mmr=use_mmr,
+                    indices=filter_indices or None,
+                    sources=filter_sources or None,
+                    page_range=(page_from or None, page_to or None),
+                    ingested_from=date_from,
+                    ingested_to=date_to,
                 )
-
-                formatted = format_answer({"answer": answer_text, "context": docs})
+                status = result.get("status")
+                if status == "partial":
+                    st.warning("Plazo agotado: se muestran solo las fuentes encontradas.")
+                elif status == "no_answer":
+                    st.info("Ningún fragmento supera el umbral de confianza: no se ha consultado al LLM.")
+                elif status == "rejected":
+                    st.warning("Sistema saturado: inténtalo de nuevo en unos segundos.")
+                elif status == "error":
+                    st.error(result.get("answer", ""))
+
+                formatted = format_answer(result)
                 st.code(formatted, language="markdown")
                 st.session_state.history.append({"q": question.strip(), "a": formatted})
             except Exception as e: